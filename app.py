@@ -1,12 +1,20 @@
 import streamlit as st
-import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import datetime
-from io import StringIO
 import pickle
 import os
+import hashlib
 import json
+from sensor_ingest import READING_COLUMNS, UPLOAD_TYPES, process_upload, ingest_files_parallel, sensor_memory_report
+import sensor_store
+import sensor_sqlite
+from sensor_store import SensorHistory
+from sensor_aggregates import reference_summary
+from sensor_query import SensorQuery
+from sensor_cache import SensorCache
+from figure_cache import FigureCache, figure_key
+from write_behind import WriteBehindPersister, atomic_write_pickle
 
 # Set page configuration
 st.set_page_config(
@@ -54,12 +62,6 @@ manifest_json = json.dumps({
 
 st.markdown(f'<link rel="manifest" href="data:application/json,{manifest_json}">', unsafe_allow_html=True)
 
-# Initialize session state
-if 'sensor_data' not in st.session_state:
-    st.session_state.sensor_data = {}
-if 'sensor_names' not in st.session_state:
-    st.session_state.sensor_names = {}
-
 # Pastel colors for different sensors
 PASTEL_COLORS = [
     "#FF9999",  # Light red
@@ -68,18 +70,91 @@ PASTEL_COLORS = [
     "#B3B3B3"   # 30% grey
 ]
 
-# File paths for persistent storage
-SENSOR_DATA_FILE = "sensor_data.pkl"
-SENSOR_NAMES_FILE = "sensor_names.pkl"
+# File path for persistent UI state (sensor data paths live in sensor_store)
 UI_STATE_FILE = "ui_state.pkl"
-
-def save_sensor_data():
-    """Save sensor data to disk for persistence"""
+# Write-behind key for sensor data saves
+SENSOR_STORE_KEY = "sensor_store"
+# Columns the raw data chart plots
+CHART_COLUMNS = ['datetime'] + READING_COLUMNS
+# First and last 15-minute slot of the time-of-day selector; this range shows whole days
+WHOLE_DAY_SLOTS = (0, 95)
+# Windows the averages chart offers, with their x-axis tick spacing, first tick and format.
+# Date axes take a spacing in milliseconds or "M<n>" months; weekly ticks start on a Monday like the windows
+DAY_MS = 86_400_000
+AVERAGE_WINDOW_TICKS = {
+    'daily': (DAY_MS, None, '%d %b'),
+    'weekly': (7 * DAY_MS, '2024-01-01', '%d %b'),
+    'monthly': ('M1', None, '%b %Y'),
+}
+# Horizontal points the raw data chart needs; longer ranges are drawn from the coarsest rollup with at least this many buckets
+CHART_PIXELS = 1600
+# Both storage backends offer the same read/write functions
+store_backend = sensor_sqlite if sensor_sqlite.SQLITE_BACKEND else sensor_store
+
+@st.cache_resource
+def get_persister():
+    """Return the process-wide write-behind persister shared by all sessions"""
+    return WriteBehindPersister()
+
+@st.cache_resource
+def get_sensor_cache():
+    """Return the process-wide sensor cache, so sessions share one copy of each sensor's history"""
+    return SensorCache()
+
+@st.cache_resource
+def get_figure_cache():
+    """Return the process-wide figure cache, so unchanged charts are not rebuilt on reruns"""
+    return FigureCache()
+
+@st.cache_resource
+def get_grid_cache():
+    """Return the process-wide cache of aligned sensor grids, shared by the comparison chart and summary"""
+    return FigureCache(max_entries=8)
+
+def chart_query(data_dict, time_range):
+    """Return the query of all sensors over the chart time range (None for all of it), shared by every chart"""
+    start, end = time_range if time_range else (None, None)
+    return SensorQuery(data_dict).between(start, end)
+
+def cached_grid(data_dict, time_range):
+    """Return the aligned grid of all sensors over the time range, built once per sensor data version"""
+    # The grid level follows from the sensors and the range, so both are the whole key
+    sensors = tuple((sensor_id, history.data_key) for sensor_id, history in data_dict.items())
+    key = (sensors, figure_key(time_range))
+    return get_grid_cache().get(key, chart_query(data_dict, time_range).align(CHART_PIXELS).execute)
+
+def cached_chart(build, data_dict, *args):
+    """Return build(data_dict, *args) from the figure cache, keyed on sensor data keys, names and the chart arguments"""
+    sensors = tuple(
+        (sensor_id, history.data_key, st.session_state.sensor_names.get(sensor_id))
+        for sensor_id, history in data_dict.items()
+    )
+    key = (build.__name__, sensors, figure_key(args))
+    return get_figure_cache().get(key, lambda: build(data_dict, *args))
+
+def combine_sensor_saves(pending, new):
+    """Fold a newer sensor save into one that is still waiting to be written"""
+    pending_data, _, pending_replace_all = pending
+    new_data, sensor_names, replace_all = new
+    if replace_all:
+        return new
+    return {**pending_data, **new_data}, sensor_names, pending_replace_all
+
+def write_sensor_save(save):
+    """Write a (possibly combined) sensor save from the write-behind thread"""
+    changed_data, sensor_names, replace_all = save
+    store_backend.write_sensor_store(changed_data, sensor_names, replace_all=replace_all)
+
+def save_sensor_data(sensor_ids=None):
+    """Save the given sensors (default: all of them) and the sensor names to disk for persistence"""
     try:
-        with open(SENSOR_DATA_FILE, 'wb') as f:
-            pickle.dump(st.session_state.sensor_data, f)
-        with open(SENSOR_NAMES_FILE, 'wb') as f:
-            pickle.dump(st.session_state.sensor_names, f)
+        if sensor_ids is None:
+            # Sensors missing from the session are deleted from the store
+            save = dict(st.session_state.sensor_data), dict(st.session_state.sensor_names), True
+        else:
+            changed_data = {sensor_id: st.session_state.sensor_data.get(sensor_id) for sensor_id in sensor_ids}
+            save = changed_data, dict(st.session_state.sensor_names), False
+        get_persister().submit(SENSOR_STORE_KEY, save, write_sensor_save, combine=combine_sensor_saves)
     except Exception as e:
         # Silent fail - don't disrupt the app if saving fails
         pass
@@ -95,6 +170,9 @@ def save_ui_state():
         'time_range_end': getattr(st.session_state, 'time_range_end', None),
         'start_time': getattr(st.session_state, 'start_time', None),
         'end_time': getattr(st.session_state, 'end_time', None),
+        'average_window': getattr(st.session_state, 'average_window', 'daily'),
+        'reference_sensor': getattr(st.session_state, 'reference_sensor', None),
+        'comparison_reading': getattr(st.session_state, 'comparison_reading', 'temperature'),
     }
     
     # Save checkbox states for all sensors
@@ -105,21 +183,18 @@ def save_ui_state():
         ui_state[f'humidity_daily_{sensor_id}'] = getattr(st.session_state, f'humidity_daily_{sensor_id}', False)
     
     try:
-        with open(UI_STATE_FILE, 'wb') as f:
-            pickle.dump(ui_state, f)
+        get_persister().submit(UI_STATE_FILE, ui_state, lambda state: atomic_write_pickle(state, UI_STATE_FILE))
     except Exception as e:
         # Silent fail - don't disrupt the app if saving fails
         pass
 
 def load_sensor_data():
-    """Load sensor data from disk if it exists"""
+    """Load sensor data from disk if it exists, as a snapshot of the shared cache"""
     try:
-        if os.path.exists(SENSOR_DATA_FILE) and os.path.exists(SENSOR_NAMES_FILE):
-            with open(SENSOR_DATA_FILE, 'rb') as f:
-                sensor_data = pickle.load(f)
-            with open(SENSOR_NAMES_FILE, 'rb') as f:
-                sensor_names = pickle.load(f)
-            return sensor_data, sensor_names
+        if store_backend is sensor_sqlite:
+            # SQLite histories hold no rows in memory, so there is nothing to share
+            return sensor_sqlite.read_sensor_store()
+        return get_sensor_cache().snapshot()
     except Exception as e:
         # Silent fail - return empty data if loading fails
         pass
@@ -150,65 +225,41 @@ def darken_color(hex_color, factor=0.2):
     # Convert back to hex
     return "#{:02x}{:02x}{:02x}".format(*darkened_rgb)
 
-def validate_csv_structure(df):
-    """Validate that the CSV has the required columns"""
-    required_columns = 5
-    if len(df.columns) < required_columns:
-        return False, f"CSV must have at least {required_columns} columns"
-
-    # Check if first column can be parsed as datetime with the expected format
-    try:
-        pd.to_datetime(df.iloc[:, 0], format='%Y/%m/%d %H:%M:%S', errors='raise')
-    except:
-        return False, "First column must contain valid date/time values in format YYYY/MM/DD HH:MM:SS"
-
-    # Check if temperature and humidity columns are numeric
-    try:
-        pd.to_numeric(df.iloc[:, 1], errors='raise')
-        pd.to_numeric(df.iloc[:, 3], errors='raise')
-    except:
-        return False, "Temperature (column 2) and humidity (column 4) must be numeric"
-
-    return True, "Valid CSV structure"
-
-def process_csv_data(uploaded_file, sensor_id):
-    """Process uploaded CSV file and return cleaned data"""
-    try:
-        # Read CSV with header row
-        stringio = StringIO(uploaded_file.getvalue().decode("utf-8"))
-        df = pd.read_csv(stringio, header=0)
-
-        # Validate structure
-        is_valid, message = validate_csv_structure(df)
-        if not is_valid:
-            return None, message
-
-        # Assign column names (use first 5 columns)
-        new_columns = ['datetime', 'temperature', 'temp_comfort', 'humidity', 'humidity_comfort']
-        if len(df.columns) > 5:
-            new_columns.extend([f'extra_{i}' for i in range(5, len(df.columns))])
-        df.columns = new_columns[:len(df.columns)]
-
-        # Convert datetime with specific format
-        df['datetime'] = pd.to_datetime(df['datetime'], format='%Y/%m/%d %H:%M:%S', errors='coerce')
-
-        # Convert numeric columns
-        df['temperature'] = pd.to_numeric(df['temperature'], errors='coerce')
-        df['humidity'] = pd.to_numeric(df['humidity'], errors='coerce')
-
-        # Remove rows with invalid data
-        df = df.dropna(subset=['datetime', 'temperature', 'humidity'])
-
-        # Sort by datetime
-        df = df.sort_values('datetime')
-
-        # Add sensor ID
-        df['sensor_id'] = sensor_id
-
-        return df, "Successfully processed CSV data"
-
-    except Exception as e:
-        return None, f"Error processing CSV: {str(e)}"
+def upload_fingerprint(uploaded_files, sensor_id):
+    """Return a content-hash key for the files uploaded into the given sensor slot"""
+    # Streamlit hands back the same uploads on every rerun, so hash each file once
+    upload_hashes = st.session_state.setdefault('upload_hashes', {})
+    digests = []
+    for uploaded_file in uploaded_files:
+        file_id = getattr(uploaded_file, 'file_id', None)
+        digest = upload_hashes.get(file_id) if file_id is not None else None
+
+        if digest is None:
+            with uploaded_file.getbuffer() as view:
+                digest = hashlib.blake2b(view, digest_size=16).hexdigest()
+            if file_id is not None:
+                upload_hashes[file_id] = digest
+        digests.append(digest)
+
+    return f"{sensor_id}:{'+'.join(digests)}"
+
+def add_range_band(fig, df, column, color, visible, secondary_y):
+    """Shade the min-max range of a rolled-up reading behind its mean line"""
+    rgb = tuple(int(color.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
+    for bound, fill in (('max', None), ('min', 'tonexty')):
+        fig.add_trace(
+            go.Scatter(
+                x=df['datetime'],
+                y=df[f"{column}_{bound}"],
+                line=dict(width=0),
+                fill=fill,
+                fillcolor="rgba({}, {}, {}, 0.25)".format(*rgb),
+                visible=visible,
+                showlegend=False,
+                hoverinfo='skip'
+            ),
+            secondary_y=secondary_y
+        )
 
 def create_dual_axis_chart(data_dict, visible_series, time_range, temp_axis_range=None):
     """Create dual-axis chart with temperature and humidity data"""
@@ -216,14 +267,9 @@ def create_dual_axis_chart(data_dict, visible_series, time_range, temp_axis_rang
     # Create subplot with secondary y-axis
     fig = make_subplots(specs=[[{"secondary_y": True}]])
 
-    # Filter data by time range if specified
-    filtered_data = {}
-    for sensor_id, df in data_dict.items():
-        if time_range:
-            mask = (df['datetime'] >= time_range[0]) & (df['datetime'] <= time_range[1])
-            filtered_data[sensor_id] = df[mask]
-        else:
-            filtered_data[sensor_id] = df
+    # Only the plotted columns of the partitions overlapping the time range are read; ranges
+    # with more samples than the chart has pixels are drawn from a min/mean/max rollup
+    filtered_data = chart_query(data_dict, time_range).columns(CHART_COLUMNS).resample(CHART_PIXELS).execute()
 
     # Add temperature traces (left axis)
     for i, (sensor_id, df) in enumerate(filtered_data.items()):
@@ -232,6 +278,8 @@ def create_dual_axis_chart(data_dict, visible_series, time_range, temp_axis_rang
 
         # Temperature line
         temp_visible = visible_series.get(f"{sensor_id}_temp", True)
+        if 'temperature_min' in df:
+            add_range_band(fig, df, 'temperature', color, temp_visible, secondary_y=False)
         fig.add_trace(
             go.Scatter(
                 x=df['datetime'],
@@ -250,6 +298,8 @@ def create_dual_axis_chart(data_dict, visible_series, time_range, temp_axis_rang
         # Humidity line
         humidity_visible = visible_series.get(f"{sensor_id}_humidity", True)
         humidity_color = darken_color(color, 0.2)
+        if 'humidity_min' in df:
+            add_range_band(fig, df, 'humidity', humidity_color, humidity_visible, secondary_y=True)
         fig.add_trace(
             go.Scatter(
                 x=df['datetime'],
@@ -333,47 +383,101 @@ def create_dual_axis_chart(data_dict, visible_series, time_range, temp_axis_rang
 
     return fig
 
-def create_daily_averages_chart(data_dict, visible_series, time_range, time_of_day_range=None, temp_axis_range=None):
-    """Create dual-axis chart with daily average temperature and humidity data"""
+def create_difference_chart(data_dict, time_range, reference, column='temperature'):
+    """Create a chart of each sensor's difference from a reference sensor on the aligned grid"""
+    fig = go.Figure()
+    grid = cached_grid(data_dict, time_range)
+    unit = "°C" if column == 'temperature' else "%"
+    reference_name = st.session_state.sensor_names.get(reference, f"Sensor {reference}")
 
-    # Create subplot with secondary y-axis
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    for i, sensor_id in enumerate(data_dict):
+        if sensor_id == reference:
+            continue
+        sensor_name = st.session_state.sensor_names.get(sensor_id, f"Sensor {sensor_id}")
+        color = PASTEL_COLORS[i % len(PASTEL_COLORS)]
+        if column == 'humidity':
+            color = darken_color(color, 0.2)
+        fig.add_trace(
+            go.Scatter(
+                x=grid.index,
+                y=grid[column][sensor_id] - grid[column][reference],
+                name=f"{sensor_name} - {reference_name}",
+                line=dict(color=color, width=2),
+                hovertemplate="<b>" + f"{sensor_name} - {reference_name}" + "</b><br>" +
+                             "Time: %{x|%Y/%m/%d %H:%M}<br>" +
+                             "Difference: %{y:+.1f}" + unit + "<br>" +
+                             "<extra></extra>"
+            )
+        )
 
-    # Calculate daily averages for each sensor
-    daily_data = {}
-    for sensor_id, df in data_dict.items():
-        # Filter by time range if specified
-        if time_range:
-            mask = (df['datetime'] >= time_range[0]) & (df['datetime'] <= time_range[1])
-            filtered_df = df[mask]
-        else:
-            filtered_df = df
+    # Update layout for minimalist design
+    fig.update_layout(
+        title=None,
+        showlegend=True,
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        ),
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        margin=dict(l=0, r=0, t=40, b=0),
+        height=400,
+        hovermode='x unified'
+    )
 
-        if not filtered_df.empty:
-            # Filter by time of day if specified
-            if time_of_day_range:
-                start_time = datetime.time(time_of_day_range[0] // 4, (time_of_day_range[0] % 4) * 15)
-                end_time = datetime.time(time_of_day_range[1] // 4, (time_of_day_range[1] % 4) * 15)
-                
-                filtered_df = filtered_df.copy()
-                filtered_df['time'] = filtered_df['datetime'].dt.time
-                
-                if start_time <= end_time:
-                    # Normal case: start before end (e.g., 06:00 to 18:00)
-                    time_mask = (filtered_df['time'] >= start_time) & (filtered_df['time'] <= end_time)
-                else:
-                    # Cross-midnight case: start after end (e.g., 18:00 to 06:00)
-                    time_mask = (filtered_df['time'] >= start_time) | (filtered_df['time'] <= end_time)
-                
-                filtered_df = filtered_df[time_mask]
+    fig.update_xaxes(
+        showgrid=True,
+        gridwidth=0.3,
+        gridcolor='#E0E0E0',
+        showline=False,
+        zeroline=False,
+        tickformat='%d %b',
+        tickangle=-45
+    )
+
+    # The reference sensor is the zero line
+    fig.update_yaxes(
+        title_text=f"{column.capitalize()} difference ({unit})",
+        showgrid=True,
+        gridwidth=0.3,
+        gridcolor='#E0E0E0',
+        showline=False,
+        zeroline=True,
+        zerolinecolor='#888888',
+        zerolinewidth=1
+    )
+
+    return fig
+
+def create_daily_averages_chart(data_dict, visible_series, time_range, time_of_day_range=None, temp_axis_range=None, window='daily'):
+    """Create dual-axis chart with daily (or weekly / monthly) average temperature and humidity data"""
 
-            # Group by date and calculate averages
-            daily_avg = filtered_df.groupby(filtered_df['datetime'].dt.date).agg({
-                'temperature': 'mean',
-                'humidity': 'mean'
-            }).reset_index()
-            daily_avg['datetime'] = pd.to_datetime(daily_avg['datetime'])
-            daily_data[sensor_id] = daily_avg
+    # Create subplot with secondary y-axis
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+
+    time_of_day = None
+    if time_of_day_range:
+        start_time = datetime.time(time_of_day_range[0] // 4, (time_of_day_range[0] % 4) * 15)
+        end_time = datetime.time(time_of_day_range[1] // 4, (time_of_day_range[1] % 4) * 15)
+        time_of_day = (start_time, end_time)
+
+    # Averages of all sensors in one pass, merged from the stored daily aggregates
+    query = chart_query(data_dict, time_range)
+    averages = query.time_of_day(time_of_day).aggregate(window, ['mean']).execute()
+    averages = averages.rename(columns={f"{column}_mean": column for column in READING_COLUMNS})
+    # Temperature percentile bands merge from the per-day quantile sketches, which cover whole days,
+    # so they are only drawn on bars that cover whole days too
+    whole_days = time_of_day_range is None or tuple(time_of_day_range) == WHOLE_DAY_SLOTS
+    if whole_days:
+        percentiles = query.aggregate(window, ['p5', 'p50', 'p95']).execute()
+        percentiles = percentiles[['sensor_id', 'datetime', 'temperature_p5', 'temperature_p50', 'temperature_p95']]
+        if not averages.empty:
+            averages = averages.merge(percentiles, on=['sensor_id', 'datetime'], how='left')
+    daily_data = {sensor_id: df for sensor_id, df in averages.groupby('sensor_id', sort=False)}
+    daily_data = {sensor_id: daily_data[sensor_id] for sensor_id in data_dict if sensor_id in daily_data}
 
     # Add temperature traces (left axis)
     for i, (sensor_id, df) in enumerate(daily_data.items()):
@@ -382,6 +486,23 @@ def create_daily_averages_chart(data_dict, visible_series, time_range, time_of_d
 
         # Temperature bars
         temp_visible = visible_series.get(f"{sensor_id}_temp_daily", True)
+        percentile_whiskers = {}
+        percentile_hover = ""
+        if whole_days:
+            # p5-p95 band as whiskers on the bar
+            percentile_whiskers = dict(
+                error_y=dict(
+                    type='data',
+                    symmetric=False,
+                    array=(df['temperature_p95'] - df['temperature']).clip(lower=0),
+                    arrayminus=(df['temperature'] - df['temperature_p5']).clip(lower=0),
+                    color=darken_color(color, 0.4),
+                    thickness=1,
+                    width=2
+                ),
+                customdata=df[['temperature_p5', 'temperature_p50', 'temperature_p95']]
+            )
+            percentile_hover = "p5 / p50 / p95: %{customdata[0]:.1f} / %{customdata[1]:.1f} / %{customdata[2]:.1f}°C<br>"
         fig.add_trace(
             go.Bar(
                 x=df['datetime'],
@@ -393,9 +514,11 @@ def create_daily_averages_chart(data_dict, visible_series, time_range, time_of_d
                 hovertemplate="<b>" + f"{sensor_name} - Avg Temperature" + "</b><br>" +
                              "Date: %{x|%Y/%m/%d}<br>" +
                              "Avg Temperature: %{y:.1f}°C<br>" +
+                             percentile_hover +
                              "<extra></extra>",
                 yaxis='y',
-                offsetgroup=f'temp_{i}'
+                offsetgroup=f'temp_{i}',
+                **percentile_whiskers
             ),
             secondary_y=False
         )
@@ -442,15 +565,17 @@ def create_daily_averages_chart(data_dict, visible_series, time_range, time_of_d
         bargroupgap=0.1
     )
 
-    # Update x-axis with day separators
+    # Update x-axis with day (week / month) separators
+    dtick, tick0, tickformat = AVERAGE_WINDOW_TICKS[window]
     fig.update_xaxes(
         showgrid=True,
         gridwidth=0.3,
         gridcolor='#E0E0E0',
         showline=False,
         zeroline=False,
-        tickformat='%d %b',
-        dtick='D1',
+        tickformat=tickformat,
+        dtick=dtick,
+        tick0=tick0,
         tickangle=-45
     )
 
@@ -515,14 +640,21 @@ def main():
     # Check password first
     check_password()
     
-    # Initialize session state if not already done
-    if 'sensor_data' not in st.session_state:
+    # Initialize session state if not already done, and pick up data written by
+    # the ingest CLI or another session since it was loaded
+    store_version = store_backend.sensor_store_version()
+    store_changed = st.session_state.get('sensor_store_version') != store_version
+    # While a save is still queued the store is behind the session, so reloading would drop it
+    if 'sensor_data' not in st.session_state or (store_changed and not get_persister().is_pending(SENSOR_STORE_KEY)):
         # Try to load from disk first
         loaded_data, loaded_names = load_sensor_data()
         st.session_state.sensor_data = loaded_data
         st.session_state.sensor_names = loaded_names
+        st.session_state.sensor_store_version = store_version
     if 'sensor_names' not in st.session_state:
         st.session_state.sensor_names = {}
+    if 'ingested_uploads' not in st.session_state:
+        st.session_state.ingested_uploads = {}
     
     # Load UI state from disk
     if 'ui_state_loaded' not in st.session_state:
@@ -545,14 +677,44 @@ def main():
     st.markdown("<h1 style='color: #888888;'>Sensor Data Visualization</h1>", unsafe_allow_html=True)
     st.markdown("Upload CSV files containing temperature and humidity sensor data for visualization")
     
-    # Show currently loaded data status
+    # Failed saves stay queued and are retried in the background; the user must know the data is not stored yet
+    for key, (error, attempts) in get_persister().failed().items():
+        what = "Sensor data" if key == SENSOR_STORE_KEY else "Display settings"
+        st.warning(f"⚠️ **{what} could not be saved** ({error}); retrying in the background after {attempts} failed attempt(s)")
+
+    # Show currently loaded data status; record counts come from each sensor's catalog
     if st.session_state.sensor_data:
         loaded_sensors = []
         for sensor_id, data in st.session_state.sensor_data.items():
             sensor_name = st.session_state.sensor_names.get(sensor_id, f"Sensor {sensor_id}")
-            loaded_sensors.append(f"{sensor_name} ({len(data)} records)")
+            loaded_sensors.append(f"{sensor_name} ({data.catalog['rows']} records)")
         
         st.info(f"📊 **Currently loaded:** {', '.join(loaded_sensors)}")
+
+        # Resident memory per session is what limits how much history we can serve
+        with st.expander("Memory usage"):
+            if store_backend is sensor_sqlite:
+                st.caption("Readings are stored in SQLite and queried per chart, so no history is held in memory")
+            else:
+                report = sensor_memory_report(st.session_state.sensor_data)
+                report['sensor_id'] = report['sensor_id'].map(
+                    lambda sensor_id: st.session_state.sensor_names.get(sensor_id, f"Sensor {sensor_id}")
+                )
+                report['legacy_bytes'] = (report['legacy_bytes'] / 1024 / 1024).round(2)
+                report['compact_bytes'] = (report['compact_bytes'] / 1024 / 1024).round(2)
+                report.columns = ['Sensor', 'Records', 'Previous schema (MB)', 'Compact schema (MB)']
+                st.dataframe(report, hide_index=True)
+                cache_stats = get_sensor_cache().stats()
+                st.caption(
+                    f"Shared cache: {cache_stats['loaded_bytes'] / 1024 / 1024:.1f} of "
+                    f"{cache_stats['max_bytes'] / 1024 / 1024:.0f} MB loaded across {cache_stats['sensors']} sensor(s), "
+                    f"{cache_stats['evictions']} eviction(s)"
+                )
+            figure_stats = get_figure_cache().stats()
+            st.caption(
+                f"Chart cache: {figure_stats['figures']} of {figure_stats['max_entries']} figures, "
+                f"{figure_stats['hits']} hit(s), {figure_stats['misses']} miss(es)"
+            )
     else:
         st.info("📤 **No data loaded** - Upload CSV files to begin visualization")
 
@@ -571,6 +733,7 @@ def main():
             if st.button("🗑️ Clear All Data", help="Remove all uploaded sensor data"):
                 st.session_state.sensor_data = {}
                 st.session_state.sensor_names = {}
+                st.session_state.ingested_uploads = {}
                 save_sensor_data()
                 save_ui_state()
                 st.rerun()
@@ -579,7 +742,7 @@ def main():
         for i in range(1, 5):
             # Check if this sensor has loaded data
             has_data = i in st.session_state.sensor_data
-            data_status = f" ({len(st.session_state.sensor_data[i])} records)" if has_data else ""
+            data_status = f" ({st.session_state.sensor_data[i].catalog['rows']} records)" if has_data else ""
             
             # Sensor name input as subheader - use saved name if available
             default_name = st.session_state.sensor_names.get(i, f"Sensor {i}")
@@ -594,52 +757,99 @@ def main():
             if sensor_name != default_name:
                 st.session_state.sensor_names[i] = sensor_name
                 if has_data:  # Only save if we have data
-                    save_sensor_data()
+                    save_sensor_data([])
 
-            # File upload
-            uploaded_file = st.file_uploader(
-                f"Choose CSV file",
-                type=['csv'],
+            # File upload (several files, e.g. monthly exports, are ingested together)
+            slot_files = st.file_uploader(
+                f"Choose CSV files (.csv, .csv.gz, .zip, .xz)",
+                type=UPLOAD_TYPES,
                 key=f"file_{i}",
-                help="Upload a new file to replace existing data" if has_data else None
+                accept_multiple_files=True,
+                help="Upload new files to replace or extend existing data" if has_data else None
             )
 
-            if uploaded_file is not None:
-                uploaded_files[i] = uploaded_file
+            # Rolling exports overlap, so allow merging into the loaded history instead of replacing it
+            append_mode = False
+            if has_data:
+                append_mode = st.checkbox(
+                    "Append to existing data",
+                    key=f"append_{i}",
+                    help="Merge the uploaded files into the loaded data; the uploaded reading wins for duplicate timestamps"
+                )
+
+            if slot_files:
+                uploaded_files[i] = slot_files
                 st.session_state.sensor_names[i] = sensor_name
 
-                # Process the file
-                with st.spinner(f"Processing Sensor {i} data..."):
-                    processed_data, message = process_csv_data(uploaded_file, i)
+                # Skip parsing and disk writes if this slot already ingested the same content
+                fingerprint = upload_fingerprint(slot_files, i)
+                cached_upload = st.session_state.ingested_uploads.get(i)
+                if cached_upload is not None and cached_upload[0] == fingerprint:
+                    _, succeeded, message = cached_upload
+                    if succeeded:
+                        st.success(message)
+                    else:
+                        st.error(message)
+                    continue
 
-                    if processed_data is not None:
-                        st.session_state.sensor_data[i] = processed_data
-                        # Save to disk for persistence
-                        save_sensor_data()
-                        save_ui_state()
-                        st.success(f"{len(processed_data)} records loaded")
+                # Process the files
+                if len(slot_files) == 1:
+                    with st.spinner(f"Processing Sensor {i} data..."):
+                        processed_data, message = process_upload(slot_files[0], slot_files[0].name, i)
+                else:
+                    # Bulk upload: parse the files in parallel worker processes
+                    progress_bar = st.progress(0.0, text=f"Processing {len(slot_files)} files for Sensor {i}...")
+
+                    def report_progress(done, total, name, progress_bar=progress_bar):
+                        progress_bar.progress(done / total, text=f"Processed {name} ({done}/{total})")
+
+                    processed_data, message = ingest_files_parallel(
+                        [(slot_file.name, slot_file.getvalue()) for slot_file in slot_files],
+                        i,
+                        progress=report_progress
+                    )
+                    progress_bar.empty()
+
+                if processed_data is not None:
+                    if append_mode:
+                        # Only the months from the first new timestamp onwards are merged and rewritten
+                        existing = st.session_state.sensor_data[i]
+                        processed_data = existing.merge(processed_data)
+                        message = f"{len(processed_data) - len(existing)} records added ({len(processed_data)} total)"
                     else:
-                        st.error(f"{message}")
-                        if i in st.session_state.sensor_data:
-                            del st.session_state.sensor_data[i]
-                            # Save updated state to disk
-                            save_sensor_data()
-                            save_ui_state()
+                        processed_data = SensorHistory.from_frame(processed_data, i)
+                        message = f"{len(processed_data)} records loaded"
+
+                    st.session_state.sensor_data[i] = processed_data
+                    # Save to disk for persistence
+                    save_sensor_data([i])
+                    save_ui_state()
+                    st.success(message)
+                else:
+                    st.error(f"{message}")
+                    # A bad file never discards history it was meant to extend
+                    if i in st.session_state.sensor_data and not append_mode:
+                        del st.session_state.sensor_data[i]
+                        # Save updated state to disk
+                        save_sensor_data([i])
+                        save_ui_state()
+
+                st.session_state.ingested_uploads[i] = (fingerprint, processed_data is not None, message)
             else:
                 # Don't remove data just because no new file is uploaded
                 # The data persists until explicitly cleared or replaced
-                pass
+                # Forget the ingested upload so adding the same file again reloads it
+                st.session_state.ingested_uploads.pop(i, None)
 
     # Main content area
     if st.session_state.sensor_data:
-        # Get time range for all data
-        all_dates = []
-        for df in st.session_state.sensor_data.values():
-            all_dates.extend(df['datetime'].tolist())
+        # Get time range for all data from the sensor catalogs, without reading any rows
+        catalogs = [history.catalog for history in st.session_state.sensor_data.values()]
+        catalogs = [catalog for catalog in catalogs if catalog['rows']]
 
-        if all_dates:
-            min_date = min(all_dates).date()
-            max_date = max(all_dates).date()
+        if catalogs:
+            min_date = min(catalog['first'] for catalog in catalogs).date()
+            max_date = max(catalog['last'] for catalog in catalogs).date()
 
             # Time range selection with slider
             st.markdown("<h3 style='color: #888888;'>Time Range Selection</h3>", unsafe_allow_html=True)
@@ -788,7 +998,8 @@ def main():
                 temp_axis_range_raw = [temp_min_raw, temp_max_raw]
 
             try:
-                chart = create_dual_axis_chart(
+                chart = cached_chart(
+                    create_dual_axis_chart,
                     st.session_state.sensor_data,
                     visible_series,
                     time_range,
@@ -898,19 +1109,83 @@ def main():
             end_interval = (end_time.hour * 4) + (end_time.minute // 15)
             time_of_day_range = (start_interval, end_interval)
 
+            # Averages per day, week or month
+            average_window = st.radio(
+                "Average per",
+                list(AVERAGE_WINDOW_TICKS),
+                format_func=lambda window: window.capitalize(),
+                horizontal=True,
+                key="average_window",
+                on_change=save_ui_state
+            )
+
             try:
-                daily_chart = create_daily_averages_chart(
+                daily_chart = cached_chart(
+                    create_daily_averages_chart,
                     st.session_state.sensor_data,
                     visible_series_daily,
                     time_range,
                     time_of_day_range,
-                    temp_axis_range_daily
+                    temp_axis_range_daily,
+                    average_window
                 )
                 st.plotly_chart(daily_chart, use_container_width=True)
 
             except Exception as e:
                 st.error(f"Error creating daily averages chart: {str(e)}")
 
+            # Sensor comparison on a common grid
+            if len(st.session_state.sensor_data) > 1:
+                st.markdown("<h3 style='color: #888888;'>Sensor Comparison</h3>", unsafe_allow_html=True)
+                sensor_ids = list(st.session_state.sensor_data)
+                sensor_labels = {
+                    sensor_id: st.session_state.sensor_names.get(sensor_id, f"Sensor {sensor_id}") for sensor_id in sensor_ids
+                }
+                if st.session_state.get('reference_sensor') not in sensor_ids:
+                    st.session_state.reference_sensor = sensor_ids[0]
+
+                col1, col2 = st.columns(2)
+                with col1:
+                    reference_sensor = st.selectbox(
+                        "Reference sensor",
+                        sensor_ids,
+                        format_func=sensor_labels.get,
+                        key="reference_sensor",
+                        on_change=save_ui_state
+                    )
+                with col2:
+                    comparison_reading = st.radio(
+                        "Compare",
+                        READING_COLUMNS,
+                        format_func=lambda column: column.capitalize(),
+                        horizontal=True,
+                        key="comparison_reading",
+                        on_change=save_ui_state
+                    )
+
+                try:
+                    difference_chart = cached_chart(
+                        create_difference_chart,
+                        st.session_state.sensor_data,
+                        time_range,
+                        reference_sensor,
+                        comparison_reading
+                    )
+                    st.plotly_chart(difference_chart, use_container_width=True)
+
+                    summary = reference_summary(cached_grid(st.session_state.sensor_data, time_range), reference_sensor)
+                    summary['sensor_id'] = summary['sensor_id'].map(sensor_labels)
+                    summary = summary.round(2)
+                    summary.columns = [
+                        'Sensor', 'Shared buckets',
+                        'Temperature difference (°C)', 'Temperature abs. difference (°C)', 'Temperature correlation',
+                        'Humidity difference (%)', 'Humidity abs. difference (%)', 'Humidity correlation',
+                    ]
+                    st.dataframe(summary, hide_index=True)
+
+                except Exception as e:
+                    st.error(f"Error creating sensor comparison: {str(e)}")
+
     else:
         # Empty state
         st.info("Please upload at least one CSV file in the sidebar to begin visualization")
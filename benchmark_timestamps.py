@@ -0,0 +1,82 @@
+"""Benchmark the fixed-width timestamp decoder against the generic pandas parser
+
+Usage: python benchmark_timestamps.py [--rows 3000000] [--repeat 3]
+"""
+import argparse
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from sensor_ingest import (
+    CSV_DATETIME_FORMAT,
+    FIXED_TIMESTAMP_WIDTH,
+    csv_line_starts,
+    decode_timestamp_bytes,
+    process_csv_data,
+)
+
+def make_csv(rows):
+    """Build a logger-style CSV export at 1-minute resolution"""
+    stamps = np.datetime64('2022-01-01T00:00:00') + np.arange(rows).astype('timedelta64[m]')
+    text = np.datetime_as_string(stamps, unit='s')
+    text = np.char.replace(np.char.replace(text, '-', '/'), 'T', ' ')
+    df = pd.DataFrame({
+        'DateTime': text,
+        'Temperature': np.round(20 + 5 * np.sin(np.arange(rows) / 500), 1),
+        'TempComfort': 'normal',
+        'Humidity': 50 + np.arange(rows) % 30,
+        'HumidityComfort': 'normal',
+    })
+    return df.to_csv(index=False).encode('utf-8')
+
+def generic_timestamps(data):
+    """Current path: read the column as Python strings, then pd.to_datetime"""
+    text = pd.read_csv(BytesIO(data), header=0, usecols=[0], dtype=str).iloc[:, 0]
+    return pd.to_datetime(text, format=CSV_DATETIME_FORMAT, errors='coerce').to_numpy()
+
+def fixed_timestamps(data):
+    """Fast path: decode the fixed byte offsets at the start of every line"""
+    raw = np.frombuffer(data, dtype=np.uint8)
+    body_start = data.index(b'\n') + 1
+    line_starts = csv_line_starts(raw[body_start:]) + body_start
+    padded = np.concatenate((raw, np.zeros(FIXED_TIMESTAMP_WIDTH, dtype=np.uint8)))
+    decoded, _ = decode_timestamp_bytes(padded[line_starts[:, None] + np.arange(FIXED_TIMESTAMP_WIDTH)])
+    return decoded
+
+def best_time(func, data, repeat):
+    """Return the fastest of several runs and the last result"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    """Time both decoders and the full CSV ingest on a generated export"""
+    parser = argparse.ArgumentParser(description="Benchmark timestamp decoding")
+    parser.add_argument('--rows', type=int, default=3_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    data = make_csv(args.rows)
+
+    generic_time, expected = best_time(generic_timestamps, data, args.repeat)
+    fixed_time, decoded = best_time(fixed_timestamps, data, args.repeat)
+    if not np.array_equal(decoded, expected):
+        raise SystemExit("Decoded timestamps differ from pd.to_datetime")
+
+    ingest_time, (df, message) = best_time(lambda d: process_csv_data(BytesIO(d), 1), data, args.repeat)
+    if df is None:
+        raise SystemExit(message)
+
+    print(f"rows:                   {args.rows:,} ({len(data) / 1e6:.0f} MB)")
+    print(f"read_csv + to_datetime: {generic_time:.3f}s")
+    print(f"fixed-width decode:     {fixed_time:.3f}s ({generic_time / fixed_time:.1f}x)")
+    print(f"process_csv_data:       {ingest_time:.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Process-wide LRU cache of built chart figures shared by all dashboard sessions
+
+Keys are small tuples of cheap identifiers (the chart builder, each sensor's
+data key and name, and the chart arguments), never the sensor frames
+themselves. Stored histories are identified by their store version and
+in-memory ones by a per-history token, so a new upload or ingest changes
+the key and the old figure simply ages out.
+
+The dashboard keeps a second, smaller instance for aligned sensor grids,
+which the comparison chart and summary share.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+FIGURE_CACHE_ENTRIES = int(os.environ.get('FIGURE_CACHE_ENTRIES', 32))
+
+def figure_key(value):
+    """Turn chart arguments (dicts, lists, tuples of plain values) into a hashable key"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, figure_key(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(figure_key(item) for item in value)
+    return value
+
+class FigureCache:
+    """Bounded LRU of built figures with hit and miss counters"""
+
+    def __init__(self, max_entries=FIGURE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # key -> figure, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """Return the cached figure for key, or build(), cache and return it"""
+        with self._lock:
+            figure = self._entries.get(key)
+            if figure is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return figure
+
+        # Built outside the lock so one slow chart does not block other sessions
+        figure = build()
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = figure
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return figure
+
+    def stats(self):
+        """Return figures cached, the cap, hits and misses so far"""
+        with self._lock:
+            return {
+                'figures': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
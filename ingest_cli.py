@@ -0,0 +1,156 @@
+"""Headless ingest of sensor CSV exports into the persistent store
+
+Runs the same parsing and cleaning as the upload widget, so heavy ingest can
+happen on the server instead of in the interactive dashboard.
+
+    python ingest_cli.py --sensor 1 exports/2024-*.csv
+    python ingest_cli.py --sensor 2 --name "Cellar" --replace cellar.csv.gz
+    python ingest_cli.py --sensor 1 --watch incoming/
+"""
+import argparse
+import glob
+import os
+import shutil
+import sys
+import time
+
+import sensor_sqlite
+import sensor_store
+from sensor_ingest import UPLOAD_TYPES, ingest_files_parallel
+
+# Files in a watched directory must keep the same size and mtime for one poll before ingesting
+WATCH_INTERVAL_SECONDS = 10
+WATCH_BATCH_SIZE = 50
+PROCESSED_DIR = "processed"
+FAILED_DIR = "failed"
+
+# Same backend as the dashboard (SENSOR_STORE_BACKEND=sqlite for the SQLite store)
+store_backend = sensor_sqlite if sensor_sqlite.SQLITE_BACKEND else sensor_store
+
+def is_upload_file(path):
+    """Check whether a path has one of the accepted upload extensions"""
+    return os.path.isfile(path) and path.lower().rsplit('.', 1)[-1] in UPLOAD_TYPES
+
+def expand_inputs(patterns):
+    """Expand file names and glob patterns into a sorted list of upload files"""
+    paths = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) or [pattern]
+        paths.extend(path for path in matches if is_upload_file(path))
+    return sorted(set(paths))
+
+def print_progress(done, total, name):
+    """Report bulk-ingest progress on stdout"""
+    print(f"  [{done}/{total}] {name}", flush=True)
+
+def ingest_paths(paths, sensor_id, sensor_name=None, replace=False):
+    """Parse files and merge (or replace) them into one sensor's stored history"""
+    df, message = ingest_files_parallel(
+        [(os.path.basename(path), path) for path in paths],
+        sensor_id,
+        progress=print_progress
+    )
+    if df is None:
+        return False, message
+
+    def merge_into(existing, sensor_names):
+        """Return the parsed frame merged into (or replacing) the stored history and name the sensor"""
+        if sensor_name:
+            sensor_names[sensor_id] = sensor_name
+        else:
+            sensor_names.setdefault(sensor_id, f"Sensor {sensor_id}")
+        # Months before the first new timestamp are linked into the new version, not rewritten
+        return existing.merge(df) if existing is not None and not replace else df
+
+    # Only this sensor is read and rewritten, under the store lock so a dashboard save
+    # landing between the read and the write is not overwritten
+    existing, merged = store_backend.update_sensor_store(sensor_id, merge_into)
+    if existing is not None and not replace:
+        message = f"{len(merged) - len(existing)} records added ({len(merged)} total)"
+    else:
+        message = f"{len(merged)} records loaded"
+    return True, message
+
+def move_into(path, directory):
+    """Move a file into a subdirectory next to it"""
+    target_dir = os.path.join(os.path.dirname(path), directory)
+    os.makedirs(target_dir, exist_ok=True)
+    shutil.move(path, os.path.join(target_dir, os.path.basename(path)))
+
+def watch_directory(directory, sensor_id, sensor_name=None, interval=WATCH_INTERVAL_SECONDS, batch_size=WATCH_BATCH_SIZE):
+    """Poll a drop directory and ingest new files in batches until interrupted"""
+    print(f"Watching {directory} for Sensor {sensor_id} (Ctrl+C to stop)", flush=True)
+    previous = {}
+
+    while True:
+        current = {}
+        for entry in os.scandir(directory):
+            if is_upload_file(entry.path):
+                stat = entry.stat()
+                current[entry.path] = (stat.st_size, stat.st_mtime_ns)
+
+        # Only files that stopped changing since the last poll are complete drops
+        ready = sorted(path for path, signature in current.items() if previous.get(path) == signature)
+        previous = current
+
+        for start in range(0, len(ready), batch_size):
+            batch = ready[start:start + batch_size]
+            print(f"Ingesting {len(batch)} file(s)", flush=True)
+            succeeded, message = ingest_paths(batch, sensor_id, sensor_name)
+
+            if succeeded:
+                done = batch
+            else:
+                # Retry one by one so a single bad file doesn't hold back the rest
+                print(f"  Batch failed ({message}); retrying files individually", flush=True)
+                done = []
+                for path in batch:
+                    file_succeeded, file_message = ingest_paths([path], sensor_id, sensor_name)
+                    if file_succeeded:
+                        done.append(path)
+                    else:
+                        print(f"  {file_message}", flush=True)
+                        move_into(path, FAILED_DIR)
+                message = f"{len(done)} of {len(batch)} file(s) ingested"
+
+            for path in done:
+                move_into(path, PROCESSED_DIR)
+                previous.pop(path, None)
+            print(f"  {message}", flush=True)
+
+        time.sleep(interval)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest sensor CSV exports into the dashboard's data store")
+    parser.add_argument('inputs', nargs='*', help="CSV files or glob patterns (.csv, .csv.gz, .zip, .xz)")
+    parser.add_argument('--sensor', type=int, required=True, choices=range(1, 5), help="Sensor slot to load into")
+    parser.add_argument('--name', help="Set the sensor's display name")
+    parser.add_argument('--replace', action='store_true', help="Replace the sensor's history instead of merging into it")
+    parser.add_argument('--watch', metavar='DIR', help="Keep ingesting files dropped into DIR")
+    parser.add_argument('--interval', type=float, default=WATCH_INTERVAL_SECONDS, help="Seconds between directory polls")
+    parser.add_argument('--batch-size', type=int, default=WATCH_BATCH_SIZE, help="Maximum files ingested per batch")
+    args = parser.parse_args(argv)
+
+    if not args.inputs and not args.watch:
+        parser.error("give input files or --watch DIR")
+
+    if args.inputs:
+        paths = expand_inputs(args.inputs)
+        if not paths:
+            print("No matching CSV files", file=sys.stderr)
+            return 1
+        print(f"Ingesting {len(paths)} file(s) into Sensor {args.sensor}", flush=True)
+        succeeded, message = ingest_paths(paths, args.sensor, args.name, args.replace)
+        print(message, flush=True)
+        if not succeeded:
+            return 1
+
+    if args.watch:
+        try:
+            watch_directory(args.watch, args.sensor, args.name, args.interval, args.batch_size)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
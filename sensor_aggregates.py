@@ -0,0 +1,492 @@
+"""Aggregates of sensor readings, built once at ingest and stored with the data
+
+Daily tables hold the row count and the sum, min and max of every reading
+for each day, so the daily chart costs O(days) instead of O(raw samples).
+
+Slot tables split every day into 96 fifteen-minute slots and hold the count
+and reading sums per slot, plus the same for samples lying exactly on a slot
+start. The time-of-day slider snaps to slot starts, so the inclusive window
+[S, E] is slots S..E-1 plus the samples exactly at E, and any window
+(including one crossing midnight) is two prefix-sum lookups per day.
+
+Rollup tables form a pyramid of min/mean/max per time bucket (1 minute,
+15 minutes, 1 hour, 1 day); each level is built from the one below it.
+Levels no wider than the sample interval are not stored. The raw chart
+reads the coarsest level that still has a point per pixel.
+
+Sketch tables hold, per day and reading, up to 32 weighted centroids of
+the values (a t-digest-style quantile sketch) plus the exact min and max.
+Sketches of several days merge into one for a week or month, so percentile
+bands never reread raw rows.
+
+aligned_grid puts all sensors on one regular grid of a rollup level, so
+sensors sampled at different times compare bucket by bucket.
+
+aggregate_windows computes hourly, daily, weekly or monthly statistics for
+all sensors in one groupby. Count, mean, min and max merge from the stored
+hourly and daily buckets and daily-or-longer percentiles from the sketches;
+spread and the remaining percentiles group the raw rows.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from sensor_ingest import READING_COLUMNS
+
+DAILY_STATS = ['sum', 'min', 'max']
+DAILY_TABLE_DTYPE = np.dtype(
+    [('day', 'datetime64[D]'), ('count', 'int64')]
+    + [(f"{column}_{stat}", 'float64') for column in READING_COLUMNS for stat in DAILY_STATS]
+)
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOT_NS = SLOT_MINUTES * 60 * 1_000_000_000
+# Per slot of each day: rows in [slot start, next slot start) and rows exactly at the slot start
+SLOT_FIELDS = ['count'] + [f"{column}_sum" for column in READING_COLUMNS]
+SLOT_TABLE_DTYPE = np.dtype(
+    [('day', 'datetime64[D]')]
+    + [(field, 'float64', (SLOTS_PER_DAY,)) for field in SLOT_FIELDS]
+    + [(f"start_{field}", 'float64', (SLOTS_PER_DAY,)) for field in SLOT_FIELDS]
+)
+
+# Rollup levels from finest to coarsest, by bucket width
+ROLLUP_LEVELS = {
+    '1min': np.timedelta64(1, 'm'),
+    '15min': np.timedelta64(15, 'm'),
+    '1h': np.timedelta64(1, 'h'),
+    '1D': np.timedelta64(1, 'D'),
+}
+# Readings keep their own names for the bucket mean, so rollups plot like raw rows
+ROLLUP_TABLE_DTYPE = np.dtype(
+    [('datetime', 'datetime64[ns]'), ('count', 'int64')]
+    + [(f"{column}{suffix}", 'float64') for column in READING_COLUMNS for suffix in ['', '_min', '_max']]
+)
+
+# Quantile sketches: per day and reading, at most SKETCH_SIZE weighted centroids
+SKETCH_SIZE = 32
+SKETCH_TABLE_DTYPE = np.dtype(
+    [('day', 'datetime64[D]')]
+    + [field for column in READING_COLUMNS for field in [
+        (f"{column}_means", 'float64', (SKETCH_SIZE,)),
+        (f"{column}_weights", 'float64', (SKETCH_SIZE,)),
+        (f"{column}_min", 'float64'),
+        (f"{column}_max", 'float64'),
+    ]]
+)
+
+# Windows and statistics of aggregate_windows; percentiles are written pNN (e.g. p95)
+AGGREGATION_WINDOWS = ['hourly', 'daily', 'weekly', 'monthly']
+WINDOW_STATS = ['count', 'mean', 'min', 'max', 'std']
+MERGEABLE_STATS = ['count', 'mean', 'min', 'max']
+PERCENTILE_STAT = re.compile(r"p(\d{1,2})")
+
+def build_daily_table(df):
+    """Return per-day row count and sum/min/max of each reading for a sorted sensor frame"""
+    days = df['datetime'].to_numpy().astype('datetime64[D]')
+    if not len(days):
+        return np.zeros(0, dtype=DAILY_TABLE_DTYPE)
+
+    starts = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1])))
+    table = np.zeros(len(starts), dtype=DAILY_TABLE_DTYPE)
+    table['day'] = days[starts]
+    table['count'] = np.diff(np.append(starts, len(days)))
+    for column in READING_COLUMNS:
+        values = df[column].to_numpy().astype('float64')
+        table[f"{column}_sum"] = np.add.reduceat(values, starts)
+        table[f"{column}_min"] = np.minimum.reduceat(values, starts)
+        table[f"{column}_max"] = np.maximum.reduceat(values, starts)
+    return table
+
+def build_slot_table(df):
+    """Return per-day, per-slot row counts and reading sums for a sorted sensor frame"""
+    times = df['datetime'].to_numpy().astype('datetime64[ns]')
+    days = times.astype('datetime64[D]')
+    if not len(days):
+        return np.zeros(0, dtype=SLOT_TABLE_DTYPE)
+
+    starts = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1])))
+    day_index = np.cumsum(np.concatenate(([False], days[1:] != days[:-1])))
+    time_of_day = (times - days).astype('int64')
+    cells = day_index * SLOTS_PER_DAY + time_of_day // SLOT_NS
+    at_start = time_of_day % SLOT_NS == 0
+    size = len(starts) * SLOTS_PER_DAY
+
+    table = np.zeros(len(starts), dtype=SLOT_TABLE_DTYPE)
+    table['day'] = days[starts]
+    weights = {'count': None, **{f"{column}_sum": df[column].to_numpy().astype('float64') for column in READING_COLUMNS}}
+    for field, values in weights.items():
+        table[field] = np.bincount(cells, values, minlength=size).reshape(-1, SLOTS_PER_DAY)
+        table[f"start_{field}"] = np.bincount(
+            cells[at_start], None if values is None else values[at_start], minlength=size
+        ).reshape(-1, SLOTS_PER_DAY)
+    return table
+
+def time_of_day_slots(time_of_day):
+    """Return the (start, end) slot indices of a time-of-day window, or None if it is not on slot starts"""
+    slots = []
+    for value in time_of_day:
+        if value.second or value.microsecond or value.minute % SLOT_MINUTES:
+            return None
+        slots.append((value.hour * 60 + value.minute) // SLOT_MINUTES)
+    return tuple(slots)
+
+def rollup_from_slots(table, slots):
+    """Return per-day count and means inside an inclusive (start, end) slot window for rows of a slot table"""
+    start, end = slots
+    sums = {}
+    for field in SLOT_FIELDS:
+        prefix = np.zeros((len(table), SLOTS_PER_DAY + 1))
+        np.cumsum(table[field], axis=1, out=prefix[:, 1:])
+        if start <= end:
+            window = prefix[:, end] - prefix[:, start]
+        else:
+            # Cross-midnight: the evening slots and the morning slots of the same date
+            window = prefix[:, SLOTS_PER_DAY] - prefix[:, start] + prefix[:, end]
+        sums[field] = window + table[f"start_{field}"][:, end]
+
+    # Days without rows inside the window are left out, as in the raw computation;
+    # slots keep no extremes, so min and max are NaN
+    has_rows = sums['count'] > 0
+    daily = pd.DataFrame({
+        'datetime': table['day'][has_rows].astype('datetime64[ns]'),
+        'count': sums['count'][has_rows].astype('int64'),
+    })
+    for column in READING_COLUMNS:
+        daily[column] = sums[f"{column}_sum"][has_rows] / sums['count'][has_rows]
+        daily[f"{column}_min"] = np.nan
+        daily[f"{column}_max"] = np.nan
+    return daily
+
+def combine_rollup(times, counts, means, mins, maxes, width):
+    """Return the rollup table of sorted (possibly already rolled up) rows in buckets of the given width"""
+    if not len(times):
+        return np.zeros(0, dtype=ROLLUP_TABLE_DTYPE)
+    width_ns = width.astype('timedelta64[ns]').astype('int64')
+    buckets = times.astype('datetime64[ns]').astype('int64')
+    buckets = buckets - buckets % width_ns
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+
+    table = np.zeros(len(starts), dtype=ROLLUP_TABLE_DTYPE)
+    table['datetime'] = buckets[starts].view('datetime64[ns]')
+    table['count'] = np.add.reduceat(counts, starts)
+    for column in READING_COLUMNS:
+        table[column] = np.add.reduceat(means[column] * counts, starts) / table['count']
+        table[f"{column}_min"] = np.minimum.reduceat(mins[column], starts)
+        table[f"{column}_max"] = np.maximum.reduceat(maxes[column], starts)
+    return table
+
+def median_interval(times):
+    """Return the median spacing of sorted timestamps, or None for fewer than two"""
+    if len(times) < 2:
+        return None
+    return np.timedelta64(int(np.median(np.diff(times.astype('datetime64[ns]').astype('int64')))), 'ns')
+
+def build_rollup_table(df, level):
+    """Return one rollup level's table straight from the rows of a sorted sensor frame"""
+    values = {column: df[column].to_numpy().astype('float64') for column in READING_COLUMNS}
+    times = df['datetime'].to_numpy()
+    return combine_rollup(times, np.ones(len(times), dtype='int64'), values, values, values, ROLLUP_LEVELS[level])
+
+def build_rollup_tables(df):
+    """Return {level: rollup table} for a sorted sensor frame, each level built from the previous one"""
+    values = {column: df[column].to_numpy().astype('float64') for column in READING_COLUMNS}
+    times = df['datetime'].to_numpy()
+    counts = np.ones(len(times), dtype='int64')
+    means = mins = maxes = values
+    interval = median_interval(times)
+
+    tables = {}
+    for level, width in ROLLUP_LEVELS.items():
+        # A level no wider than the sample interval holds about one bucket per row; it is
+        # never drawn (see rollup_level) and other reads build it from the rows instead
+        if interval is not None and width <= interval:
+            continue
+        table = tables[level] = combine_rollup(times, counts, means, mins, maxes, width)
+        times, counts = table['datetime'], table['count']
+        means = {column: table[column] for column in READING_COLUMNS}
+        mins = {column: table[f"{column}_min"] for column in READING_COLUMNS}
+        maxes = {column: table[f"{column}_max"] for column in READING_COLUMNS}
+    return tables
+
+def compress_sketches(groups, means, weights, size=SKETCH_SIZE):
+    """Merge weighted centroids into at most size centroids per group; returns (means, weights) of shape (groups, size)"""
+    # Centroids are ranked by value within their group and binned on the arcsine scale of
+    # their quantile (as in t-digest), so bins are narrowest at the tails where p5/p95 live
+    n_groups = int(groups.max()) + 1 if len(groups) else 0
+    order = np.lexsort((means, groups))
+    groups, means, weights = groups[order], means[order], weights[order]
+    totals = np.bincount(groups, weights, minlength=n_groups)
+    cumulative = np.cumsum(weights)
+    group_starts = np.concatenate(([0.0], np.cumsum(totals)[:-1]))
+    quantiles = (cumulative - weights / 2 - group_starts[groups]) / totals[groups]
+    bins = np.minimum((size * (np.arcsin(2 * quantiles - 1) / np.pi + 0.5)).astype('int64'), size - 1)
+
+    cells = groups * size + bins
+    sketch_weights = np.bincount(cells, weights, minlength=n_groups * size).reshape(-1, size)
+    sums = np.bincount(cells, means * weights, minlength=n_groups * size).reshape(-1, size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sketch_means = np.where(sketch_weights > 0, sums / sketch_weights, np.nan)
+    return sketch_means, sketch_weights
+
+def build_sketch_table(df):
+    """Return per-day quantile sketches of every reading for a sorted sensor frame"""
+    days = df['datetime'].to_numpy().astype('datetime64[D]')
+    if not len(days):
+        return np.zeros(0, dtype=SKETCH_TABLE_DTYPE)
+
+    new_day = np.concatenate(([True], days[1:] != days[:-1]))
+    starts = np.flatnonzero(new_day)
+    groups = np.cumsum(new_day) - 1
+    table = np.zeros(len(starts), dtype=SKETCH_TABLE_DTYPE)
+    table['day'] = days[starts]
+    for column in READING_COLUMNS:
+        values = df[column].to_numpy().astype('float64')
+        table[f"{column}_means"], table[f"{column}_weights"] = compress_sketches(groups, values, np.ones(len(values)))
+        table[f"{column}_min"] = np.minimum.reduceat(values, starts)
+        table[f"{column}_max"] = np.maximum.reduceat(values, starts)
+    return table
+
+def merge_sketches(table, groups):
+    """Merge the rows of a sketch table by group index; returns {column: (means, weights, mins, maxes)} per group"""
+    merged = {}
+    rows = np.repeat(groups, SKETCH_SIZE)
+    for column in READING_COLUMNS:
+        weights = table[f"{column}_weights"].reshape(-1)
+        used = weights > 0
+        means, merged_weights = compress_sketches(rows[used], table[f"{column}_means"].reshape(-1)[used], weights[used])
+        n_groups = len(means)
+        mins = np.full(n_groups, np.inf)
+        maxes = np.full(n_groups, -np.inf)
+        np.minimum.at(mins, groups, table[f"{column}_min"])
+        np.maximum.at(maxes, groups, table[f"{column}_max"])
+        merged[column] = means, merged_weights, mins, maxes
+    return merged
+
+def sketch_quantiles(means, weights, mins, maxes, quantile):
+    """Estimate one quantile per sketch row by interpolating between centroid centres and the extremes"""
+    used = weights > 0
+    centres = np.cumsum(weights, axis=1) - weights / 2
+    centres = np.where(used, centres / weights.sum(axis=1, keepdims=True), np.inf)
+    rows = len(means)
+    knots = np.hstack([np.zeros((rows, 1)), centres, np.ones((rows, 1))])
+    values = np.hstack([mins[:, None], np.where(used, means, np.nan), maxes[:, None]])
+    # Unused centroids sort to the end of each row, behind the max
+    order = np.argsort(knots, axis=1, kind='stable')
+    knots, values = np.take_along_axis(knots, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+    upper = np.clip((knots < quantile).sum(axis=1), 1, knots.shape[1] - 1)[:, None]
+    x0, x1 = np.take_along_axis(knots, upper - 1, axis=1)[:, 0], np.take_along_axis(knots, upper, axis=1)[:, 0]
+    y0, y1 = np.take_along_axis(values, upper - 1, axis=1)[:, 0], np.take_along_axis(values, upper, axis=1)[:, 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(x1 > x0, y0 + (y1 - y0) * (quantile - x0) / (x1 - x0), y1)
+
+def build_aggregate_tables(df):
+    """Return every aggregate table stored with a partition, by name, for a sorted sensor frame"""
+    tables = {'daily': build_daily_table(df), 'slots': build_slot_table(df), 'sketches': build_sketch_table(df)}
+    for level, table in build_rollup_tables(df).items():
+        tables[f"rollup_{level}"] = table
+    return tables
+
+def rollup_bucket_start(value, level):
+    """Return the start of the rollup bucket holding a datetime64[ns] value (None stays None)"""
+    if value is None:
+        return None
+    width = ROLLUP_LEVELS[level].astype('timedelta64[ns]').astype('int64')
+    return value - np.timedelta64(int(value.astype('int64') % width), 'ns')
+
+def rollup_level(start, end, pixels, interval=None):
+    """Return the coarsest rollup level with at least one bucket per pixel over [start, end], or None for raw rows"""
+    # A level no wider than the sampling interval holds one row per bucket, so raw rows are drawn instead
+    span = pd.Timestamp(end) - pd.Timestamp(start)
+    for level, width in reversed(ROLLUP_LEVELS.items()):
+        if span // pd.Timedelta(width) >= pixels:
+            return level if interval is None or pd.Timedelta(width) > interval else None
+    return None
+
+def grid_level(start, end, pixels, intervals=()):
+    """Return the finest rollup level for a common grid over [start, end]: no finer than the slowest sensor, at most pixels buckets"""
+    span = pd.Timestamp(end) - pd.Timestamp(start)
+    slowest = max((interval for interval in intervals if interval is not None), default=None)
+    for level, width in ROLLUP_LEVELS.items():
+        if (slowest is None or pd.Timedelta(width) >= slowest) and span // pd.Timedelta(width) <= pixels:
+            return level
+    return list(ROLLUP_LEVELS)[-1]
+
+def aligned_grid(histories, level, start=None, end=None):
+    """Return the bucket means of all sensors on one regular grid of a rollup level, columns (reading, sensor_id)"""
+    # Every sensor's rollup buckets start on the same multiples of the level width, so
+    # aligning them is a pivot on the bucket start rather than an as-of join of raw rows
+    frames = [
+        history.rollup(level, start, end)[['datetime'] + READING_COLUMNS].assign(sensor_id=sensor_id)
+        for sensor_id, history in histories.items()
+    ]
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=pd.MultiIndex.from_product([READING_COLUMNS, list(histories)]))
+    grid = pd.concat(frames, ignore_index=True).pivot(index='datetime', columns='sensor_id', values=READING_COLUMNS)
+    grid = grid.reindex(pd.date_range(grid.index[0], grid.index[-1], freq=pd.Timedelta(ROLLUP_LEVELS[level]), name='datetime'))
+    return grid.reindex(columns=pd.MultiIndex.from_product([READING_COLUMNS, list(histories)]))
+
+def reference_summary(grid, reference):
+    """Return per sensor the shared buckets and mean difference, mean absolute difference and correlation against a reference sensor"""
+    rows = []
+    for sensor_id in grid[READING_COLUMNS[0]].columns:
+        if sensor_id == reference:
+            continue
+        row = {'sensor_id': sensor_id}
+        for column in READING_COLUMNS:
+            pair = grid[column][[sensor_id, reference]].dropna()
+            difference = pair[sensor_id] - pair[reference]
+            row['buckets'] = len(pair)
+            row[f"{column}_mean_difference"] = difference.mean()
+            row[f"{column}_mean_abs_difference"] = difference.abs().mean()
+            row[f"{column}_correlation"] = pair[sensor_id].corr(pair[reference]) if len(pair) > 1 else np.nan
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def rollup_from_daily_table(table):
+    """Return the rows of a daily table as a per-day rollup frame"""
+    daily = pd.DataFrame({'datetime': table['day'].astype('datetime64[ns]'), 'count': table['count']})
+    for column in READING_COLUMNS:
+        daily[column] = table[f"{column}_sum"] / table['count']
+        daily[f"{column}_min"] = table[f"{column}_min"]
+        daily[f"{column}_max"] = table[f"{column}_max"]
+    return daily
+
+def time_of_day_bounds(time_of_day):
+    """Return an inclusive (start_time, end_time) window as nanoseconds since midnight"""
+    return tuple(
+        ((value.hour * 60 + value.minute) * 60 + value.second) * 1_000_000_000 + value.microsecond * 1000
+        for value in time_of_day
+    )
+
+def time_of_day_mask(times, time_of_day):
+    """Return a boolean mask of timestamps inside an inclusive (start_time, end_time) window"""
+    # start_time > end_time crosses midnight; times of day are compared as nanoseconds since midnight
+    times = times.astype('datetime64[ns]')
+    since_midnight = (times - times.astype('datetime64[D]')).astype('int64')
+    start_time, end_time = time_of_day_bounds(time_of_day)
+    if start_time <= end_time:
+        # Normal case: start before end (e.g., 06:00 to 18:00)
+        return (since_midnight >= start_time) & (since_midnight <= end_time)
+    # Cross-midnight case: start after end (e.g., 18:00 to 06:00)
+    return (since_midnight >= start_time) | (since_midnight <= end_time)
+
+def rollup_frame(df, width, time_of_day=None):
+    """Return the rollup frame of sorted raw rows in buckets of the given width, optionally inside a time-of-day window"""
+    times = df['datetime'].to_numpy()
+    values = {column: df[column].to_numpy().astype('float64') for column in READING_COLUMNS}
+    if time_of_day:
+        mask = time_of_day_mask(times, time_of_day)
+        times = times[mask]
+        values = {column: array[mask] for column, array in values.items()}
+    counts = np.ones(len(times), dtype='int64')
+    return pd.DataFrame(combine_rollup(times, counts, values, values, values, width))
+
+def window_starts(times, window):
+    """Return the start of the hourly, daily, weekly (Monday) or monthly window holding each timestamp"""
+    times = times.astype('datetime64[ns]')
+    if window == 'hourly':
+        return times.astype('datetime64[h]').astype('datetime64[ns]')
+    if window == 'monthly':
+        return times.astype('datetime64[M]').astype('datetime64[ns]')
+    days = times.astype('datetime64[D]')
+    if window == 'weekly':
+        # 1970-01-01 was a Thursday, three days after a Monday
+        days = days - (days.astype('int64') + 3) % 7
+    return days.astype('datetime64[ns]')
+
+def sketch_windows(histories, window, percentiles, start=None, end=None):
+    """Return per-window percentiles of every reading, merged from the per-day quantile sketches"""
+    columns = ['sensor_id', 'datetime'] + [f"{column}_{stat}" for column in READING_COLUMNS for stat in percentiles]
+    frames = []
+    for sensor_id, history in histories.items():
+        table = history.day_sketches(start, end)
+        if not len(table):
+            continue
+        windows, groups = np.unique(window_starts(table['day'], window), return_inverse=True)
+        merged = merge_sketches(table, groups.reshape(-1))
+        frame = {'sensor_id': sensor_id, 'datetime': windows}
+        for column in READING_COLUMNS:
+            means, weights, mins, maxes = merged[column]
+            for stat in percentiles:
+                quantile = int(PERCENTILE_STAT.fullmatch(stat).group(1)) / 100
+                frame[f"{column}_{stat}"] = sketch_quantiles(means, weights, mins, maxes, quantile)
+        frames.append(pd.DataFrame(frame))
+    return pd.concat(frames, ignore_index=True)[columns] if frames else pd.DataFrame(columns=columns)
+
+def aggregate_windows(histories, window='daily', stats=('mean',), start=None, end=None, time_of_day=None):
+    """Return one frame of per-window statistics for all sensors: sensor_id, datetime and {reading}_{stat} columns"""
+    # stats are count, mean, min, max, std and percentiles such as p5 or p95
+    if window not in AGGREGATION_WINDOWS:
+        raise ValueError(f"Unknown aggregation window: {window}")
+    unknown = [stat for stat in stats if stat not in WINDOW_STATS and not PERCENTILE_STAT.fullmatch(stat)]
+    if unknown:
+        raise ValueError(f"Unknown aggregation statistics: {unknown}")
+
+    columns = ['sensor_id', 'datetime'] + [f"{column}_{stat}" for column in READING_COLUMNS for stat in stats]
+    # Daily and longer percentiles merge from the per-day quantile sketches; the sketches
+    # cover whole days, so hourly and time-of-day percentiles still need the raw rows
+    percentiles = [stat for stat in stats if PERCENTILE_STAT.fullmatch(stat)]
+    others = [stat for stat in stats if stat not in percentiles]
+    if percentiles and window != 'hourly' and not time_of_day and set(others) <= set(MERGEABLE_STATS):
+        result = sketch_windows(histories, window, percentiles, start, end)
+        if not len(result):
+            return pd.DataFrame(columns=columns)
+        if others:
+            result = aggregate_windows(histories, window, others, start, end).merge(result, on=['sensor_id', 'datetime'])
+        return result[columns]
+
+    # Count, mean, min and max merge from stored hourly or daily buckets without touching raw rows;
+    # time-of-day windows come from the slot cube, which keeps no extremes
+    mergeable = ['count', 'mean'] if time_of_day else MERGEABLE_STATS
+    if set(stats) <= set(mergeable):
+        unit = 'h' if window == 'hourly' else 'D'
+        frames = [
+            history.window_buckets(unit, start, end, time_of_day).assign(sensor_id=sensor_id)
+            for sensor_id, history in histories.items()
+        ]
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        buckets = pd.concat(frames, ignore_index=True)
+        for column in READING_COLUMNS:
+            buckets[f"{column}_sum"] = buckets[column] * buckets['count']
+        buckets['datetime'] = window_starts(buckets['datetime'].to_numpy(), window)
+
+        merged = buckets.groupby(['sensor_id', 'datetime'], sort=True).agg(
+            count=('count', 'sum'),
+            **{f"{column}_{stat}": (f"{column}_{stat}", stat) for column in READING_COLUMNS for stat in ['sum', 'min', 'max']}
+        ).reset_index()
+        merged = merged[merged['count'] > 0]
+        result = merged[['sensor_id', 'datetime']].copy()
+        for column in READING_COLUMNS:
+            for stat in stats:
+                if stat == 'count':
+                    result[f"{column}_count"] = merged['count']
+                elif stat == 'mean':
+                    result[f"{column}_mean"] = merged[f"{column}_sum"] / merged['count']
+                else:
+                    result[f"{column}_{stat}"] = merged[f"{column}_{stat}"]
+        return result.reset_index(drop=True)
+
+    # Spread and percentiles need the raw rows: one groupby over all sensors at once
+    frames = []
+    for sensor_id, history in histories.items():
+        df = history.read(start, end, ['datetime'] + READING_COLUMNS, time_of_day)
+        frames.append(pd.DataFrame({
+            'sensor_id': sensor_id,
+            'datetime': window_starts(df['datetime'].to_numpy(), window),
+            **{column: df[column].to_numpy() for column in READING_COLUMNS},
+        }))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    grouped = pd.concat(frames, ignore_index=True).groupby(['sensor_id', 'datetime'], sort=True)[READING_COLUMNS]
+
+    results = []
+    for stat in stats:
+        percentile = PERCENTILE_STAT.fullmatch(stat)
+        values = grouped.quantile(int(percentile.group(1)) / 100) if percentile else grouped.agg(stat)
+        results.append(values.add_suffix(f"_{stat}"))
+    return pd.concat(results, axis=1).reset_index()[columns]
@@ -0,0 +1,89 @@
+"""Process-wide cache of stored sensor histories shared by all dashboard sessions
+
+Sessions get snapshots: a fresh dict of shared, read-only SensorHistory
+handles keyed by sensor id. Histories are never modified in place; an upload
+or append builds a new history for that session only, so sharing needs no
+copying. Entries are keyed by the sensor's stored version, so a write by the
+dashboard or the ingest CLI replaces them on the next snapshot. Snapshots
+also delete replaced versions that no session's history still refers to.
+
+Loaded partitions count towards a memory cap; when it is exceeded the least
+recently read sensors are unloaded and read again from disk on next use.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from sensor_store import (
+    STORE_DIR, STORE_MMAP, collect_retired_versions, migrate_legacy_pickles, read_manifest, read_sensor
+)
+
+SENSOR_CACHE_MB = float(os.environ.get('SENSOR_CACHE_MB', 512))
+
+class SensorCache:
+    """Shared, version-keyed sensor histories with LRU unloading above a memory cap"""
+
+    def __init__(self, max_mb=SENSOR_CACHE_MB, store_dir=STORE_DIR, mmap=STORE_MMAP):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.store_dir = store_dir
+        self.mmap = mmap
+        self.evictions = 0
+        # (sensor_id, version) -> SensorHistory, least recently read first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """Return ({sensor_id: shared SensorHistory}, sensor names) for the current store version"""
+        migrate_legacy_pickles(self.store_dir)
+        manifest = read_manifest(self.store_dir)
+        current = {(int(sensor_id), version) for sensor_id, version in manifest['sensors'].items()}
+
+        sensor_data = {}
+        with self._lock:
+            # Versions no longer in the manifest were replaced or deleted; sessions still
+            # holding them keep their loaded partitions until they take a new snapshot
+            for key in [key for key in self._entries if key not in current]:
+                del self._entries[key]
+
+            for sensor_id, version in sorted(current):
+                history = self._entries.get((sensor_id, version))
+                if history is None:
+                    history = read_sensor(sensor_id, self.store_dir, manifest, self.mmap)
+                    history.cache = self
+                    self._entries[(sensor_id, version)] = history
+                sensor_data[sensor_id] = history
+
+        # Versions replaced by earlier writes are deleted once no session holds them any more
+        collect_retired_versions(self.store_dir)
+
+        sensor_names = {int(sensor_id): name for sensor_id, name in manifest['names'].items()}
+        return sensor_data, sensor_names
+
+    def touch(self, history):
+        """Mark a history as just read and unload cold ones while the cache is over its cap"""
+        with self._lock:
+            key = next((key for key, entry in self._entries.items() if entry is history), None)
+            if key is None:
+                return
+            self._entries.move_to_end(key)
+
+            total = sum(entry.loaded_bytes for entry in self._entries.values())
+            for cold_key in list(self._entries):
+                if total <= self.max_bytes or cold_key == key:
+                    break
+                cold = self._entries[cold_key]
+                cold_bytes = cold.loaded_bytes
+                if cold_bytes:
+                    cold.unload()
+                    total -= cold_bytes
+                    self.evictions += 1
+
+    def stats(self):
+        """Return sensors cached, bytes loaded, the cap and evictions so far"""
+        with self._lock:
+            return {
+                'sensors': len(self._entries),
+                'loaded_bytes': sum(entry.loaded_bytes for entry in self._entries.values()),
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+            }
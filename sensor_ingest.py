@@ -0,0 +1,402 @@
+"""CSV ingestion for sensor logger exports"""
+import os
+import gzip
+import lzma
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+import multiprocessing
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Working memory budget for CSV ingestion (override with SENSOR_INGEST_MEMORY_MB)
+INGEST_MEMORY_BUDGET_MB = float(os.environ.get("SENSOR_INGEST_MEMORY_MB", 64))
+INGEST_SAMPLE_BYTES = 256 * 1024
+INGEST_MIN_BLOCK_BYTES = 64 * 1024
+
+# CSV layout written by the loggers
+CSV_COLUMNS = ['datetime', 'temperature', 'temp_comfort', 'humidity', 'humidity_comfort']
+CSV_DATETIME_FORMAT = '%Y/%m/%d %H:%M:%S'
+# Timestamps are read as strings only when they miss the fixed-width fast path; numeric
+# columns are left to the C parser's float path
+CSV_DTYPES = {'datetime': str, 'temp_comfort': 'category', 'humidity_comfort': 'category'}
+
+# Compact in-memory schema: float32 readings and dictionary-encoded comfort flags.
+# Extra CSV columns are not kept and the sensor id lives in DataFrame.attrs.
+READING_COLUMNS = ['temperature', 'humidity']
+FLAG_COLUMNS = ['temp_comfort', 'humidity_comfort']
+READING_DTYPE = 'float32'
+SENSOR_FRAME_DTYPES = {
+    'temperature': READING_DTYPE,
+    'humidity': READING_DTYPE,
+    'temp_comfort': 'category',
+    'humidity_comfort': 'category',
+}
+# Bytes per row in the old schema: datetime, float64 readings and an int64 sensor_id, plus a
+# pointer and a Python object per comfort flag (as memory_usage(deep=True) counts them). Flags
+# are one-character markers or blank; each is counted as a marker, the larger of the two
+# Bytes per row in the compact schema: datetime, float32 readings and int8 flag codes; the
+# few category labels per partition are left out
+COMPACT_ROW_BYTES = 8 + len(READING_COLUMNS) * np.dtype(READING_DTYPE).itemsize + len(FLAG_COLUMNS)
+LEGACY_ROW_BYTES = 8 * 4 + len(FLAG_COLUMNS) * (8 + max(sys.getsizeof('*'), sys.getsizeof(np.nan)))
+
+# Byte layout of CSV_DATETIME_FORMAT plus the field delimiter, e.g. "2025/07/15 00:15:00,"
+FIXED_TIMESTAMP_WIDTH = 20
+FIXED_TIMESTAMP_SEPARATORS = {4: '/', 7: '/', 10: ' ', 13: ':', 16: ':', 19: ','}
+FIXED_TIMESTAMP_FIELDS = {'year': (0, 4), 'month': (5, 2), 'day': (8, 2), 'hour': (11, 2), 'minute': (14, 2), 'second': (17, 2)}
+
+# Upload extensions accepted by the uploader; .gz and .xz wrap one CSV, .zip may hold several
+UPLOAD_TYPES = ['csv', 'gz', 'zip', 'xz']
+
+# Process pool size for bulk ingestion (override with SENSOR_INGEST_WORKERS)
+INGEST_WORKERS = int(os.environ.get("SENSOR_INGEST_WORKERS", os.cpu_count() or 1))
+
+def validate_csv_structure(columns):
+    """Validate that the CSV header has the required columns"""
+    required_columns = 5
+    if len(columns) < required_columns:
+        return False, f"CSV must have at least {required_columns} columns"
+
+    return True, "Valid CSV structure"
+
+def csv_column_names(column_count):
+    """Return internal column names for a CSV with the given number of columns"""
+    # Assign column names (use first 5 columns)
+    new_columns = list(CSV_COLUMNS)
+    if column_count > 5:
+        new_columns.extend([f'extra_{i}' for i in range(5, column_count)])
+    return new_columns[:column_count]
+
+def inspect_csv_layout(buffer, memory_budget_mb=INGEST_MEMORY_BUDGET_MB):
+    """Read the CSV header and size raw byte blocks to fit the memory budget"""
+    # Measure the in-memory cost of a small sample, then rewind for the real read
+    sample_bytes = buffer.read(INGEST_SAMPLE_BYTES)
+    buffer.seek(0)
+    sample = pd.read_csv(BytesIO(sample_bytes), header=0)
+
+    if sample.empty:
+        return sample.columns, INGEST_MIN_BLOCK_BYTES
+
+    bytes_per_row = sample.memory_usage(deep=True, index=False).sum() / len(sample)
+    line_bytes = len(sample_bytes) / (len(sample) + 1)
+    # The raw block, its parsed chunk and the converted copy are alive at the same time
+    budget_rows = memory_budget_mb * 1024 * 1024 / (2 * bytes_per_row + line_bytes)
+    return sample.columns, max(INGEST_MIN_BLOCK_BYTES, int(budget_rows * line_bytes))
+
+def iter_csv_blocks(buffer, block_bytes):
+    """Yield raw byte blocks of the CSV body that each end on a line boundary"""
+    # Skip the header line
+    buffer.readline()
+
+    carry = b''
+    while True:
+        data = buffer.read(block_bytes)
+        if not data:
+            if carry.strip():
+                yield carry + b'\n'
+            return
+
+        data = carry + data
+        cut = data.rfind(b'\n') + 1
+        carry = data[cut:]
+        if cut:
+            yield data[:cut]
+
+def csv_line_starts(raw):
+    """Return byte offsets of the non-blank lines in a block, in the order pandas reads them"""
+    line_ends = np.flatnonzero(raw == ord('\n'))
+    line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+    # read_csv skips empty lines, including bare carriage returns
+    lengths = line_ends - line_starts
+    blank = (lengths == 0) | ((lengths == 1) & (raw[line_starts] == ord('\r')))
+    return line_starts[~blank]
+
+def first_invalid_line(raw_values, parsed_values):
+    """Return the CSV line number of the first value that failed to parse, if any"""
+    invalid = parsed_values.isna() & raw_values.notna()
+    if not invalid.any():
+        return None
+    # Index labels count data rows from 0; line 1 is the header
+    return int(invalid.idxmax()) + 2
+
+def decode_timestamp_bytes(fields):
+    """Decode fixed-width YYYY/MM/DD HH:MM:SS byte rows into datetime64[ns] and a match mask"""
+    # Check separators, then that every digit slot holds 0-9
+    matches = np.ones(len(fields), dtype=bool)
+    for offset, separator in FIXED_TIMESTAMP_SEPARATORS.items():
+        matches &= (fields[:, offset] == ord(separator))
+
+    values = {}
+    for name, (first, count) in FIXED_TIMESTAMP_FIELDS.items():
+        number = np.zeros(len(fields), dtype=np.int32)
+        for offset in range(first, first + count):
+            digit = fields[:, offset] - np.uint8(ord('0'))
+            matches &= (digit <= 9)
+            number = number * 10 + digit
+        values[name] = number
+
+    # Stay inside the datetime64[ns] range and reject impossible fields
+    matches &= (values['year'] >= 1678) & (values['year'] <= 2261)
+    matches &= (values['month'] >= 1) & (values['month'] <= 12) & (values['day'] >= 1)
+    matches &= (values['hour'] < 24) & (values['minute'] < 60) & (values['second'] < 60)
+    year = np.where(matches, values['year'], 1970)
+    month = np.where(matches, values['month'], 1)
+    day = np.where(matches, values['day'], 1)
+
+    months = ((year - 1970) * 12 + (month - 1)).astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+    # Day 31 of a 30-day month rolls into the next month
+    matches &= (days.astype('datetime64[M]') == months)
+
+    seconds = values['hour'] * 3600 + values['minute'] * 60 + values['second']
+    decoded = days.astype('datetime64[ns]') + (seconds.astype(np.int64) * 1_000_000_000).astype('timedelta64[ns]')
+    decoded[~matches] = np.datetime64('NaT')
+    return decoded, matches
+
+def parse_csv_block(block, column_names, first_row):
+    """Validate and convert one raw CSV block in a single typed pass"""
+    # The numeric and flag columns go through the C parser; timestamps are decoded from the raw bytes
+    chunk = pd.read_csv(
+        BytesIO(block),
+        header=None,
+        names=column_names,
+        usecols=CSV_COLUMNS[1:],
+        dtype=CSV_DTYPES,
+        encoding='utf-8'
+    )
+    chunk.index = pd.RangeIndex(first_row, first_row + len(chunk))
+
+    raw = np.frombuffer(block, dtype=np.uint8)
+    line_starts = csv_line_starts(raw)
+    if len(line_starts) == len(chunk):
+        padded = np.concatenate((raw, np.zeros(FIXED_TIMESTAMP_WIDTH, dtype=np.uint8)))
+        fields = padded[line_starts[:, None] + np.arange(FIXED_TIMESTAMP_WIDTH)]
+        decoded, matches = decode_timestamp_bytes(fields)
+    else:
+        # Quoted newlines or other unusual layouts: let the generic parser handle every row
+        decoded, matches = np.full(len(chunk), np.datetime64('NaT'), dtype='datetime64[ns]'), np.zeros(len(chunk), dtype=bool)
+    timestamps = pd.Series(decoded, index=chunk.index)
+
+    # Rows outside the fixed layout fall back to the current parser
+    if not matches.all():
+        text = pd.read_csv(BytesIO(block), header=None, names=column_names, usecols=['datetime'], dtype=CSV_DTYPES, encoding='utf-8')['datetime']
+        text.index = chunk.index
+        fallback = ~matches
+        timestamps[fallback] = pd.to_datetime(text[fallback], format=CSV_DATETIME_FORMAT, errors='coerce')
+        bad_line = first_invalid_line(text, timestamps)
+        if bad_line is not None:
+            return None, f"First column must contain valid date/time values in format YYYY/MM/DD HH:MM:SS (line {bad_line})"
+    chunk.insert(0, 'datetime', timestamps)
+
+    # The C parser already produced floats unless a column holds non-numeric text
+    for column in ('temperature', 'humidity'):
+        if chunk[column].dtype == object:
+            values = pd.to_numeric(chunk[column], errors='coerce')
+            bad_line = first_invalid_line(chunk[column], values)
+            if bad_line is not None:
+                return None, f"Temperature (column 2) and humidity (column 4) must be numeric (line {bad_line})"
+            chunk[column] = values
+        chunk[column] = chunk[column].astype(READING_DTYPE, copy=False)
+
+    return chunk, None
+
+def process_csv_data(uploaded_file, sensor_id, memory_budget_mb=INGEST_MEMORY_BUDGET_MB):
+    """Process uploaded CSV file in bounded-memory blocks and return cleaned data"""
+    try:
+        # Parse straight from the upload's byte buffer instead of decoding a full copy
+        uploaded_file.seek(0)
+        header, block_bytes = inspect_csv_layout(uploaded_file, memory_budget_mb)
+
+        # Validate structure
+        is_valid, message = validate_csv_structure(header)
+        if not is_valid:
+            return None, message
+        column_names = csv_column_names(len(header))
+
+        parsed_chunks = []
+        rows_read = 0
+        for block in iter_csv_blocks(uploaded_file, block_bytes):
+            parsed, message = parse_csv_block(block, column_names, rows_read)
+            if parsed is None:
+                return None, message
+            rows_read += len(parsed)
+
+            # Remove rows with missing data
+            parsed_chunks.append(parsed.dropna(subset=['datetime', 'temperature', 'humidity']))
+
+        if not parsed_chunks:
+            return compact_sensor_frame(pd.DataFrame(columns=CSV_COLUMNS), sensor_id), "Successfully processed CSV data"
+
+        df = pd.concat(parsed_chunks)
+        del parsed_chunks
+
+        # Sort by datetime (logger exports are usually already in order)
+        if not df['datetime'].is_monotonic_increasing:
+            df = df.sort_values('datetime')
+
+        return compact_sensor_frame(df, sensor_id), "Successfully processed CSV data"
+
+    except Exception as e:
+        return None, f"Error processing CSV: {str(e)}"
+
+def compact_sensor_frame(df, sensor_id=None):
+    """Convert a sensor frame to the compact schema and tag it with its sensor id"""
+    if sensor_id is None:
+        sensor_id = df.attrs.get('sensor_id')
+
+    # Drops extra CSV columns and the per-row sensor_id column of older frames
+    df = df[CSV_COLUMNS].astype(SENSOR_FRAME_DTYPES)
+    df['datetime'] = df['datetime'].astype('datetime64[ns]')
+    df.attrs['sensor_id'] = sensor_id
+    return df
+
+def sensor_memory_report(sensor_data):
+    """Return in-memory bytes per sensor in the compact schema next to the old schema"""
+    rows = []
+    for sensor_id, data in sensor_data.items():
+        # Sized from the record counts alone, so no partition is loaded just to be measured
+        rows.append({
+            'sensor_id': sensor_id,
+            'records': len(data),
+            'legacy_bytes': len(data) * LEGACY_ROW_BYTES,
+            'compact_bytes': len(data) * COMPACT_ROW_BYTES,
+        })
+    return pd.DataFrame(rows, columns=['sensor_id', 'records', 'legacy_bytes', 'compact_bytes'])
+
+def merge_sensor_frames(existing, new):
+    """Merge a sorted new frame into a sorted existing frame, keeping the newest reading per timestamp"""
+    if existing is None or existing.empty:
+        return new
+    if new.empty:
+        return existing
+
+    # History before the first new timestamp is untouched; only the overlapping tail is merged
+    split = existing['datetime'].searchsorted(new['datetime'].iloc[0], side='left')
+    head = existing.iloc[:split]
+    tail = existing.iloc[split:]
+
+    if tail.empty:
+        merged = new
+    else:
+        # Merge the two sorted runs by position; on equal timestamps existing rows go first
+        tail_times = tail['datetime'].to_numpy()
+        new_times = new['datetime'].to_numpy()
+        order = np.empty(len(tail) + len(new), dtype=np.int64)
+        order[np.searchsorted(new_times, tail_times, side='left') + np.arange(len(tail))] = np.arange(len(tail))
+        order[np.searchsorted(tail_times, new_times, side='right') + np.arange(len(new))] = np.arange(len(tail), len(tail) + len(new))
+        merged = pd.concat([tail, new]).iloc[order]
+
+    # De-duplicate on timestamp so the newest upload wins
+    merged = merged[~merged['datetime'].duplicated(keep='last')]
+    # Concatenating frames with different flag categories falls back to object columns
+    return compact_sensor_frame(pd.concat([head, merged], ignore_index=True), existing.attrs.get('sensor_id'))
+
+def open_csv_streams(buffer, name):
+    """Return (name, stream) pairs for the CSV files inside a plain or compressed upload"""
+    # Streams decompress lazily as the parser reads blocks, so the expanded file never sits in memory
+    extension = name.lower().rsplit('.', 1)[-1]
+    if extension == 'gz':
+        return [(name, gzip.GzipFile(fileobj=buffer, mode='rb'))]
+    if extension == 'xz':
+        return [(name, lzma.LZMAFile(buffer, mode='rb'))]
+    if extension == 'zip':
+        archive = zipfile.ZipFile(buffer)
+        members = [
+            member for member in archive.infolist()
+            if not member.is_dir() and member.filename.lower().endswith('.csv')
+        ]
+        return [(f"{name}/{member.filename}", archive.open(member)) for member in members]
+    return [(name, buffer)]
+
+def process_upload(buffer, name, sensor_id, memory_budget_mb=INGEST_MEMORY_BUDGET_MB):
+    """Process a plain or compressed (gzip, zip, xz) CSV upload and return cleaned data"""
+    try:
+        streams = open_csv_streams(buffer, name)
+    except (OSError, EOFError, lzma.LZMAError, zipfile.BadZipFile) as e:
+        return None, f"Error reading compressed file: {str(e)}"
+    if not streams:
+        return None, "Zip archive contains no CSV files"
+
+    frames = []
+    for stream_name, stream in streams:
+        df, message = process_csv_data(stream, sensor_id, memory_budget_mb)
+        if df is None:
+            return None, message if len(streams) == 1 else f"{stream_name}: {message}"
+        frames.append(df)
+
+    if len(frames) == 1:
+        return frames[0], message
+
+    df = combine_sensor_frames(frames)
+    if df is None:
+        df = frames[0]
+    return df, f"Successfully processed {len(frames)} CSV files"
+
+def ingest_upload(name, source, sensor_id, memory_budget_mb=INGEST_MEMORY_BUDGET_MB):
+    """Process one upload given as raw bytes or a file path (runs inside bulk-ingest workers)"""
+    if isinstance(source, bytes):
+        return process_upload(BytesIO(source), name, sensor_id, memory_budget_mb)
+    with open(source, 'rb') as f:
+        return process_upload(f, name, sensor_id, memory_budget_mb)
+
+def combine_sensor_frames(frames):
+    """Combine frames parsed from several files into one frame in timestamp order"""
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return None
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    sensor_id = frames[0].attrs.get('sensor_id')
+
+    # Monthly exports usually don't overlap, so they only need to be stacked in order
+    by_start = sorted(frames, key=lambda frame: frame['datetime'].iloc[0])
+    if all(a['datetime'].iloc[-1] < b['datetime'].iloc[0] for a, b in zip(by_start, by_start[1:])):
+        return compact_sensor_frame(pd.concat(by_start, ignore_index=True), sensor_id)
+
+    # Overlapping files: a stable sort over the sorted runs keeps upload order for equal
+    # timestamps, so the file uploaded last wins when de-duplicating
+    combined = pd.concat(frames, ignore_index=True)
+    combined = combined.iloc[np.argsort(combined['datetime'].to_numpy(), kind='stable')]
+    combined = combined[~combined['datetime'].duplicated(keep='last')]
+    return compact_sensor_frame(combined.reset_index(drop=True), sensor_id)
+
+def ingest_files_parallel(files, sensor_id, progress=None, max_workers=INGEST_WORKERS, memory_budget_mb=INGEST_MEMORY_BUDGET_MB):
+    """Parse many (name, bytes or path) uploads on a process pool and merge them in timestamp order"""
+    frames = [None] * len(files)
+
+    def collect(done, index, result):
+        df, message = result
+        if df is None:
+            return f"{files[index][0]}: {message}"
+        frames[index] = df
+        if progress is not None:
+            progress(done, len(files), files[index][0])
+        return None
+
+    if max_workers <= 1 or len(files) == 1:
+        # Not worth starting worker processes
+        for index, (name, source) in enumerate(files):
+            error = collect(index + 1, index, ingest_upload(name, source, sensor_id, memory_budget_mb))
+            if error is not None:
+                return None, error
+    else:
+        # Spawned workers only import this module, never the Streamlit script
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(files)), mp_context=context) as pool:
+            futures = {
+                pool.submit(ingest_upload, name, source, sensor_id, memory_budget_mb): index
+                for index, (name, source) in enumerate(files)
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                error = collect(done, futures[future], future.result())
+                if error is not None:
+                    for pending in futures:
+                        pending.cancel()
+                    return None, error
+
+    df = combine_sensor_frames(frames)
+    if df is None:
+        return None, "CSV files contain no data rows"
+    return df, f"Successfully processed {len(files)} CSV files"
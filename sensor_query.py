@@ -0,0 +1,126 @@
+"""Lazy, composable queries over sensor histories
+
+A SensorQuery records the stages of a request (sensor selection, time
+range, time-of-day window, columns, resampling to a chart width, a common
+grid or windowed aggregation) without reading anything. Every stage returns
+a new query, so a base query can be shared and refined. plan() resolves the
+stages into one source per sensor (raw rows or a rollup level), one grid
+level, or one call of the aggregation engine, and execute() runs that plan
+once.
+
+Filters are pushed down to the storage behind each history: time ranges
+cut .npy partitions by binary search and become the WHERE clause in
+SQLite, time-of-day windows are applied while the rows are read, and only
+the requested columns are loaded. No stage materializes a full frame that a
+later stage filters again.
+"""
+from sensor_aggregates import aggregate_windows, aligned_grid, grid_level, rollup_level
+from sensor_ingest import CSV_COLUMNS
+
+QUERY_OUTPUTS = ['rows', 'grid', 'windows']
+DEFAULT_STAGES = {
+    'sensor_ids': None,
+    'start': None,
+    'end': None,
+    'time_of_day': None,
+    'columns': CSV_COLUMNS,
+    'pixels': None,
+    'output': 'rows',
+    'window': 'daily',
+    'stats': ['mean'],
+}
+
+class SensorQuery:
+    """Lazy query over a dict of sensor histories; nothing is read until execute()"""
+
+    def __init__(self, histories, **stages):
+        self.histories = histories
+        self.stages = {**DEFAULT_STAGES, **stages}
+
+    def refine(self, **stages):
+        """Return a new query with the given stages replaced"""
+        return SensorQuery(self.histories, **{**self.stages, **stages})
+
+    def sensors(self, sensor_ids):
+        """Keep only the given sensors (None keeps all of them)"""
+        return self.refine(sensor_ids=None if sensor_ids is None else list(sensor_ids))
+
+    def between(self, start=None, end=None):
+        """Keep rows between start and end (inclusive, either may be None)"""
+        return self.refine(start=start, end=end)
+
+    def time_of_day(self, time_of_day):
+        """Keep rows inside an inclusive (start_time, end_time) window; start_time > end_time crosses midnight"""
+        return self.refine(time_of_day=time_of_day)
+
+    def columns(self, columns):
+        """Read only the given columns of raw rows"""
+        return self.refine(columns=list(columns))
+
+    def resample(self, pixels):
+        """Return at most about one rollup bucket per pixel per sensor, or raw rows when they are sparser"""
+        return self.refine(output='rows', pixels=pixels)
+
+    def align(self, pixels):
+        """Return all sensors on one common grid of at most pixels buckets"""
+        return self.refine(output='grid', pixels=pixels)
+
+    def aggregate(self, window='daily', stats=('mean',)):
+        """Return hourly, daily, weekly or monthly statistics of all sensors in one frame"""
+        return self.refine(output='windows', window=window, stats=list(stats))
+
+    def selected(self):
+        """Return the selected histories in their original order"""
+        sensor_ids = self.stages['sensor_ids']
+        return {
+            sensor_id: history for sensor_id, history in self.histories.items()
+            if sensor_ids is None or sensor_id in sensor_ids
+        }
+
+    def plan(self):
+        """Resolve the stages into the stages plus 'sources': the rollup level (None for raw rows) each sensor is read from"""
+        stages = self.stages
+        if stages['output'] not in QUERY_OUTPUTS:
+            raise ValueError(f"Unknown query output: {stages['output']}")
+        if stages['output'] == 'grid' and stages['time_of_day']:
+            raise ValueError("Aligned grids cover whole days and take no time-of-day window")
+
+        # Catalogs give the bounds of open-ended ranges and the sample intervals without reading any rows
+        catalogs = {sensor_id: history.catalog for sensor_id, history in self.selected().items()}
+        stored = [catalog for catalog in catalogs.values() if catalog['rows']]
+        start = stages['start'] if stages['start'] is not None else min((catalog['first'] for catalog in stored), default=None)
+        end = stages['end'] if stages['end'] is not None else max((catalog['last'] for catalog in stored), default=None)
+
+        sources = {sensor_id: None for sensor_id in catalogs}
+        if stages['output'] == 'grid' and stored:
+            level = grid_level(start, end, stages['pixels'], [catalog['interval'] for catalog in stored])
+            sources = {sensor_id: level for sensor_id in catalogs}
+        elif stages['output'] == 'rows' and stages['pixels'] and not stages['time_of_day']:
+            # Rollup buckets ignore the time of day, so windows are always answered from raw rows
+            sources = {
+                sensor_id: rollup_level(start, end, stages['pixels'], catalog['interval'])
+                if catalog['interval'] is not None else None
+                for sensor_id, catalog in catalogs.items()
+            }
+        return {**stages, 'sources': sources}
+
+    def execute(self):
+        """Run the plan: a frame per sensor for rows, one frame for a grid or windows"""
+        plan = self.plan()
+        histories = {sensor_id: self.histories[sensor_id] for sensor_id in plan['sources']}
+        start, end, time_of_day = plan['start'], plan['end'], plan['time_of_day']
+
+        if plan['output'] == 'windows':
+            return aggregate_windows(histories, plan['window'], plan['stats'], start, end, time_of_day)
+        if plan['output'] == 'grid':
+            level = next((level for level in plan['sources'].values() if level), '1D')
+            return aligned_grid(histories, level, start, end)
+
+        frames = {}
+        for sensor_id, level in plan['sources'].items():
+            history = histories[sensor_id]
+            if level:
+                frames[sensor_id] = history.rollup(level, start, end)
+            else:
+                frames[sensor_id] = history.read(start, end, plan['columns'], time_of_day)
+        return frames
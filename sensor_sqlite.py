@@ -0,0 +1,619 @@
+"""Optional embedded SQLite backend for sensor data (SENSOR_STORE_BACKEND=sqlite)
+
+Readings live in one table whose primary key (sensor_id, datetime) is the
+index every query runs on, so time-range reads are indexed SQL queries
+instead of scans of in-memory frames. Per-day and per-15-minute-slot
+aggregates and the rollup pyramid are rebuilt in SQL for the days a write
+touches; the per-day quantile sketches are built in Python and stored as
+blobs. Timestamps are stored as integer nanoseconds. Appending to a sensor
+only holds and rewrites the rows from the first new day on.
+
+The module offers the same functions as sensor_store (read_sensor,
+read_sensor_names, read_sensor_store, write_sensor_store,
+update_sensor_store, sensor_store_version), so callers pick one module as their backend. The
+first time the database is created, existing data from the .npy store (or
+the legacy pickles) is copied into it.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+import sensor_store
+from sensor_aggregates import (
+    DAILY_TABLE_DTYPE, ROLLUP_LEVELS, ROLLUP_TABLE_DTYPE, SKETCH_TABLE_DTYPE, SLOT_FIELDS, SLOT_NS, SLOT_TABLE_DTYPE,
+    build_rollup_table, build_sketch_table, median_interval, rollup_bucket_start, time_of_day_bounds
+)
+from sensor_ingest import CSV_COLUMNS, FLAG_COLUMNS, READING_COLUMNS, SENSOR_FRAME_DTYPES, merge_sensor_frames
+from sensor_store import SensorHistory, as_sensor_history, to_datetime64
+
+SQLITE_BACKEND = os.environ.get('SENSOR_STORE_BACKEND', 'npy') == 'sqlite'
+SQLITE_PATH = os.environ.get('SENSOR_STORE_SQLITE', "sensor_store.sqlite")
+
+NANOSECONDS_PER_DAY = 86_400_000_000_000
+# Bumped when derived tables change, so existing databases rebuild them once
+SCHEMA_VERSION = 7
+# Columns of the sensors table, which doubles as the catalog
+CATALOG_COLUMNS = "sensor_id, rows, first, last, interval, version"
+INT64_MIN = np.iinfo(np.int64).min
+INT64_MAX = np.iinfo(np.int64).max
+ONE_NS = np.timedelta64(1, 'ns')
+
+# Databases this process has already set up; later connections skip the schema check
+INITIALIZED_PATHS = set()
+INITIALIZED_PATHS_LOCK = threading.Lock()
+
+def bucket_offset_sql(width_ns):
+    """Return SQL for the nanoseconds since the start of a timestamp's bucket, also for dates before 1970"""
+    return f"(((datetime % {width_ns}) + {width_ns}) % {width_ns})"
+
+TIME_OF_DAY_SQL = bucket_offset_sql(NANOSECONDS_PER_DAY)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    sensor_id INTEGER NOT NULL,
+    datetime INTEGER NOT NULL,
+    temperature REAL,
+    temp_comfort TEXT,
+    humidity REAL,
+    humidity_comfort TEXT,
+    PRIMARY KEY (sensor_id, datetime)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sensors (
+    sensor_id INTEGER PRIMARY KEY,
+    rows INTEGER NOT NULL,
+    first INTEGER NOT NULL,
+    last INTEGER NOT NULL,
+    interval INTEGER,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS sensor_names (
+    sensor_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS daily (
+    sensor_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    temperature_sum REAL,
+    temperature_min REAL,
+    temperature_max REAL,
+    humidity_sum REAL,
+    humidity_min REAL,
+    humidity_max REAL,
+    PRIMARY KEY (sensor_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS slots (
+    sensor_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    temperature_sum REAL,
+    humidity_sum REAL,
+    start_count INTEGER NOT NULL,
+    start_temperature_sum REAL,
+    start_humidity_sum REAL,
+    PRIMARY KEY (sensor_id, day, slot)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollups (
+    sensor_id INTEGER NOT NULL,
+    level TEXT NOT NULL,
+    datetime INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    temperature REAL,
+    temperature_min REAL,
+    temperature_max REAL,
+    humidity REAL,
+    humidity_min REAL,
+    humidity_max REAL,
+    PRIMARY KEY (sensor_id, level, datetime)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sketches (
+    sensor_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    temperature_means BLOB NOT NULL,
+    temperature_weights BLOB NOT NULL,
+    temperature_min REAL,
+    temperature_max REAL,
+    humidity_means BLOB NOT NULL,
+    humidity_weights BLOB NOT NULL,
+    humidity_min REAL,
+    humidity_max REAL,
+    PRIMARY KEY (sensor_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS store (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+def connect(path=SQLITE_PATH):
+    """Open the database, creating the schema (and migrating the .npy store) on first use in this process"""
+    created = not os.path.exists(path)
+    if not created and os.path.abspath(path) in INITIALIZED_PATHS:
+        return sqlite3.connect(path, timeout=30)
+    with INITIALIZED_PATHS_LOCK:
+        conn = setup_database(path, created)
+        INITIALIZED_PATHS.add(os.path.abspath(path))
+    return conn
+
+def setup_database(path, created):
+    """Connect and create or upgrade the schema; a new database gets the .npy store's data"""
+    conn = sqlite3.connect(path, timeout=30)
+    # WAL lets sessions keep reading while the write-behind thread or the CLI writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    if store_value(conn, 'schema') != SCHEMA_VERSION:
+        with conn:
+            # The catalog columns were added to the sensors table after it was first created
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(sensors)")}
+            if 'interval' not in columns:
+                conn.execute("ALTER TABLE sensors ADD COLUMN interval INTEGER")
+            if 'version' not in columns:
+                conn.execute("ALTER TABLE sensors ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            for (sensor_id,) in conn.execute("SELECT sensor_id FROM sensors").fetchall():
+                times = np.array(conn.execute(
+                    "SELECT datetime FROM readings WHERE sensor_id = ? ORDER BY datetime", (sensor_id,)
+                ).fetchall(), dtype='int64').reshape(-1).view('datetime64[ns]')
+                interval = median_interval(times)
+                build_aggregates(conn, sensor_id, interval=None if interval is None else pd.Timedelta(interval))
+                conn.execute(
+                    "UPDATE sensors SET interval = ?, version = ? WHERE sensor_id = ?",
+                    (None if interval is None else int(interval.astype('int64')), store_value(conn, 'version') or 0, sensor_id)
+                )
+            conn.execute("INSERT OR REPLACE INTO store VALUES ('schema', ?)", (SCHEMA_VERSION,))
+    if created:
+        sensor_data, sensor_names = sensor_store.read_sensor_store()
+        if sensor_data or sensor_names:
+            write_sensor_store(sensor_data, sensor_names, path, conn=conn)
+    return conn
+
+def store_value(conn, key):
+    """Return an integer from the store table, or None if it was never set"""
+    row = conn.execute("SELECT value FROM store WHERE key = ?", (key,)).fetchone()
+    return None if row is None else row[0]
+
+def build_aggregates(conn, sensor_id, since=None, interval=None):
+    """Rebuild a sensor's per-day and per-slot aggregates, rollups and sketches from its readings
+
+    since (a midnight) limits the rebuild to the days from then on; every
+    rollup level is at most a day wide, so no bucket straddles it. Levels no
+    wider than the sensor's sample interval are not stored (see rollup).
+    """
+    since_ns = time_bound(since, INT64_MIN)
+    delete_aggregates(conn, sensor_id, since)
+    conn.execute(
+        f"INSERT INTO daily SELECT sensor_id, datetime - {TIME_OF_DAY_SQL} AS day, COUNT(*), "
+        "SUM(temperature), MIN(temperature), MAX(temperature), SUM(humidity), MIN(humidity), MAX(humidity) "
+        "FROM readings WHERE sensor_id = ? AND datetime >= ? GROUP BY day",
+        (sensor_id, since_ns)
+    )
+    at_start = f"{TIME_OF_DAY_SQL} % {SLOT_NS} = 0"
+    conn.execute(
+        f"INSERT INTO slots SELECT sensor_id, datetime - {TIME_OF_DAY_SQL} AS day, {TIME_OF_DAY_SQL} / {SLOT_NS} AS slot, "
+        f"COUNT(*), SUM(temperature), SUM(humidity), "
+        f"SUM({at_start}), TOTAL(CASE WHEN {at_start} THEN temperature END), TOTAL(CASE WHEN {at_start} THEN humidity END) "
+        "FROM readings WHERE sensor_id = ? AND datetime >= ? GROUP BY day, slot",
+        (sensor_id, since_ns)
+    )
+    for level, width in ROLLUP_LEVELS.items():
+        if interval is not None and pd.Timedelta(width) <= interval:
+            continue
+        width_ns = int(width.astype('timedelta64[ns]').astype('int64'))
+        conn.execute(
+            f"INSERT INTO rollups SELECT sensor_id, ?, datetime - {bucket_offset_sql(width_ns)} AS bucket, COUNT(*), "
+            "AVG(temperature), MIN(temperature), MAX(temperature), AVG(humidity), MIN(humidity), MAX(humidity) "
+            "FROM readings WHERE sensor_id = ? AND datetime >= ? GROUP BY bucket",
+            (level, sensor_id, since_ns)
+        )
+    build_sketches(conn, sensor_id, since_ns)
+
+def build_sketches(conn, sensor_id, since_ns=INT64_MIN):
+    """Rebuild a sensor's per-day quantile sketches from its readings at or after since_ns"""
+    records = conn.execute(
+        f"SELECT datetime, {', '.join(READING_COLUMNS)} FROM readings WHERE sensor_id = ? AND datetime >= ? ORDER BY datetime",
+        (sensor_id, since_ns)
+    ).fetchall()
+    values = np.array(records, dtype='float64').reshape(-1, 1 + len(READING_COLUMNS))
+    df = pd.DataFrame({
+        'datetime': np.array([record[0] for record in records], dtype='int64').view('datetime64[ns]'),
+        **{column: values[:, index] for index, column in enumerate(READING_COLUMNS, start=1)},
+    })
+    table = build_sketch_table(df)
+    conn.executemany(
+        f"INSERT INTO sketches VALUES (?, {', '.join('?' * len(SKETCH_TABLE_DTYPE.names))})",
+        [
+            (sensor_id, int(row['day'].astype('datetime64[ns]').astype('int64')),
+             *[row[field].tobytes() if row[field].shape else float(row[field]) for field in SKETCH_TABLE_DTYPE.names[1:]])
+            for row in table
+        ]
+    )
+
+def delete_aggregates(conn, sensor_id, since=None):
+    """Delete a sensor's aggregate rows, only those from the day of since on if given"""
+    since_ns = time_bound(since, INT64_MIN)
+    for table in ['daily', 'slots', 'sketches']:
+        conn.execute(f"DELETE FROM {table} WHERE sensor_id = ? AND day >= ?", (sensor_id, since_ns))
+    conn.execute("DELETE FROM rollups WHERE sensor_id = ? AND datetime >= ?", (sensor_id, since_ns))
+
+def time_bound(value, default):
+    """Convert an inclusive datetime bound (or None) to integer nanoseconds"""
+    value = to_datetime64(value)
+    return default if value is None else int(value.astype('int64'))
+
+def frame_records(df, sensor_id):
+    """Yield (sensor_id, datetime, ...) insert tuples for a sensor frame; NaN becomes NULL"""
+    flags = [df[column].astype(object).where(df[column].notna(), None).tolist() for column in FLAG_COLUMNS]
+    return zip(
+        repeat(sensor_id),
+        df['datetime'].to_numpy().view('int64').tolist(),
+        df['temperature'].to_numpy(dtype='float64').tolist(),
+        flags[0],
+        df['humidity'].to_numpy(dtype='float64').tolist(),
+        flags[1],
+    )
+
+class SqliteSensorHistory(SensorHistory):
+    """Sensor history that answers reads and daily means with indexed queries on the SQLite store"""
+
+    def __init__(self, sensor_id, rows, first, last, interval=None, version=None, path=SQLITE_PATH):
+        super().__init__(sensor_id, [])
+        self.rows = rows
+        self.first = first
+        self.last = last
+        self.path = path
+        self.version = version
+        # The sensors table is the catalog
+        self._catalog = {
+            'first': self.start,
+            'last': self.end,
+            'rows': rows,
+            'interval': None if interval is None else pd.Timedelta(interval),
+            'version': version,
+        }
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def start(self):
+        """First timestamp, or None for an empty history"""
+        return pd.Timestamp(self.first) if self.rows else None
+
+    @property
+    def end(self):
+        """Last timestamp, or None for an empty history"""
+        return pd.Timestamp(self.last) if self.rows else None
+
+    def frames(self):
+        """Yield the whole history as one frame"""
+        yield self.read()
+
+    def read(self, start=None, end=None, columns=CSV_COLUMNS, time_of_day=None):
+        """Return the rows between start and end (inclusive, either may be None) as one frame"""
+        # Column names come from the fixed sensor schema, never from user input
+        unknown = set(columns) - set(CSV_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown sensor columns: {sorted(unknown)}")
+        # An inclusive time-of-day window is filtered in SQL; start_time > end_time crosses midnight
+        window, window_bounds = "", ()
+        if time_of_day:
+            window_bounds = time_of_day_bounds(time_of_day)
+            join = "AND" if window_bounds[0] <= window_bounds[1] else "OR"
+            window = f" AND ({TIME_OF_DAY_SQL} >= ? {join} {TIME_OF_DAY_SQL} <= ?)"
+        with closing(connect(self.path)) as conn:
+            records = conn.execute(
+                f"SELECT {', '.join(columns)} FROM readings "
+                f"WHERE sensor_id = ? AND datetime BETWEEN ? AND ?{window} ORDER BY datetime",
+                (self.sensor_id, time_bound(start, INT64_MIN), time_bound(end, INT64_MAX), *window_bounds)
+            ).fetchall()
+
+        df = pd.DataFrame.from_records(records, columns=columns)
+        if 'datetime' in df:
+            df['datetime'] = df['datetime'].to_numpy(dtype='int64').view('datetime64[ns]')
+        df = df.astype({column: SENSOR_FRAME_DTYPES[column] for column in columns if column in SENSOR_FRAME_DTYPES})
+        df.attrs['sensor_id'] = self.sensor_id
+        return df
+
+    def daily_table(self, first_day, end_day):
+        """Return the per-day aggregates for days in [first_day, end_day)"""
+        with closing(connect(self.path)) as conn:
+            records = conn.execute(
+                "SELECT day, count, temperature_sum, temperature_min, temperature_max, humidity_sum, humidity_min, humidity_max "
+                "FROM daily WHERE sensor_id = ? AND day >= ? AND day < ? ORDER BY day",
+                (self.sensor_id, time_bound(first_day, INT64_MIN), time_bound(end_day, INT64_MAX))
+            ).fetchall()
+        table = np.zeros(len(records), dtype=DAILY_TABLE_DTYPE)
+        if records:
+            values = np.array(records, dtype='float64')
+            table['day'] = np.array([record[0] for record in records], dtype='int64').view('datetime64[ns]').astype('datetime64[D]')
+            for index, field in enumerate(DAILY_TABLE_DTYPE.names[1:], start=1):
+                table[field] = values[:, index]
+        return table
+
+    def slot_table(self, first_day, end_day):
+        """Return the per-day, per-15-minute-slot aggregates for days in [first_day, end_day)"""
+        with closing(connect(self.path)) as conn:
+            records = conn.execute(
+                f"SELECT day, slot, {', '.join(SLOT_FIELDS)}, {', '.join(f'start_{field}' for field in SLOT_FIELDS)} "
+                "FROM slots WHERE sensor_id = ? AND day >= ? AND day < ? ORDER BY day, slot",
+                (self.sensor_id, time_bound(first_day, INT64_MIN), time_bound(end_day, INT64_MAX))
+            ).fetchall()
+        values = np.array(records, dtype='float64').reshape(-1, 2 + 2 * len(SLOT_FIELDS))
+        days, day_index = np.unique(np.array([record[0] for record in records], dtype='int64'), return_inverse=True)
+        slots = values[:, 1].astype('int64')
+        table = np.zeros(len(days), dtype=SLOT_TABLE_DTYPE)
+        table['day'] = days.view('datetime64[ns]').astype('datetime64[D]')
+        for index, field in enumerate(SLOT_FIELDS + [f"start_{field}" for field in SLOT_FIELDS], start=2):
+            table[field][day_index, slots] = values[:, index]
+        return table
+
+    def sketch_table(self, first_day, end_day):
+        """Return the per-day quantile sketches for days in [first_day, end_day)"""
+        with closing(connect(self.path)) as conn:
+            records = conn.execute(
+                f"SELECT {', '.join(SKETCH_TABLE_DTYPE.names)} FROM sketches "
+                "WHERE sensor_id = ? AND day >= ? AND day < ? ORDER BY day",
+                (self.sensor_id, time_bound(first_day, INT64_MIN), time_bound(end_day, INT64_MAX))
+            ).fetchall()
+        table = np.zeros(len(records), dtype=SKETCH_TABLE_DTYPE)
+        for index, record in enumerate(records):
+            table[index]['day'] = np.datetime64(record[0], 'ns').astype('datetime64[D]')
+            for field, value in zip(SKETCH_TABLE_DTYPE.names[1:], record[1:]):
+                table[index][field] = np.frombuffer(value, dtype='float64') if isinstance(value, bytes) else value
+        return table
+
+    def rollup(self, level, start=None, end=None):
+        """Return the min/mean/max rows of one rollup level for the buckets overlapping [start, end]"""
+        start = rollup_bucket_start(to_datetime64(start), level)
+        interval = self.catalog['interval']
+        if interval is not None and pd.Timedelta(ROLLUP_LEVELS[level]) <= interval:
+            # Levels no wider than the sample interval are not stored; their buckets come from the rows
+            end = rollup_bucket_start(to_datetime64(end), level)
+            rows = self.read(start, None if end is None else end + ROLLUP_LEVELS[level] - ONE_NS, ['datetime'] + READING_COLUMNS)
+            df = pd.DataFrame(build_rollup_table(rows, level))
+            df.attrs['sensor_id'] = self.sensor_id
+            return df
+        with closing(connect(self.path)) as conn:
+            records = conn.execute(
+                f"SELECT {', '.join(ROLLUP_TABLE_DTYPE.names)} FROM rollups "
+                "WHERE sensor_id = ? AND level = ? AND datetime BETWEEN ? AND ? ORDER BY datetime",
+                (self.sensor_id, level, time_bound(start, INT64_MIN), time_bound(end, INT64_MAX))
+            ).fetchall()
+        df = pd.DataFrame.from_records(records, columns=list(ROLLUP_TABLE_DTYPE.names))
+        df = df.astype({name: ROLLUP_TABLE_DTYPE[name] for name in ROLLUP_TABLE_DTYPE.names[1:]})
+        df['datetime'] = df['datetime'].to_numpy(dtype='int64').view('datetime64[ns]')
+        df.attrs['sensor_id'] = self.sensor_id
+        return df
+
+    def merge(self, new):
+        """Return a history with a sorted new frame merged in; days before the new data stay in the database"""
+        if new.empty:
+            return self
+        return merge_from(self, self, first_new_day(new), new)
+
+class SqliteMergedHistory(SensorHistory):
+    """A stored SQLite history with new rows merged in from the split (a midnight) on
+
+    Rows before the split are read from the database, the merged rows from
+    the split on are held in memory. Every rollup level is at most a day
+    wide, so each day, slot and bucket lies wholly on one side of the split,
+    and writing the history rewrites only the rows and aggregates after it.
+    """
+
+    def __init__(self, base, split, tail, head_rows):
+        super().__init__(base.sensor_id, [])
+        self.base = base
+        self.split = split
+        self.tail = tail
+        self.head_rows = head_rows
+        base_interval = base.catalog['interval']
+        self._catalog = {
+            'first': self.start,
+            'last': self.end,
+            'rows': len(self),
+            'interval': tail.catalog['interval'] if base_interval is None else base_interval,
+            'version': None,
+        }
+
+    def __len__(self):
+        return self.head_rows + len(self.tail)
+
+    @property
+    def start(self):
+        """First timestamp, or None for an empty history"""
+        return self.base.start if self.head_rows else self.tail.start
+
+    @property
+    def end(self):
+        """Last timestamp, or None for an empty history"""
+        return self.tail.end if len(self.tail) else self.base.end
+
+    def head_bounds(self, start, end):
+        """Return [start, end] clipped to the rows before the split, or None if they do not overlap"""
+        start, end = to_datetime64(start), to_datetime64(end)
+        if not self.head_rows or (start is not None and start >= self.split):
+            return None
+        return start, self.split - ONE_NS if end is None else min(end, self.split - ONE_NS)
+
+    def frames(self):
+        """Yield the rows before the split, then the merged rows"""
+        if self.head_rows:
+            yield self.base.read(None, self.split - ONE_NS)
+        yield from self.tail.frames()
+
+    def read(self, start=None, end=None, columns=CSV_COLUMNS, time_of_day=None):
+        """Return the rows between start and end (inclusive, either may be None) as one frame"""
+        head = self.head_bounds(start, end)
+        frames = [self.tail.read(start, end, columns, time_of_day)]
+        if head is not None:
+            frames.insert(0, self.base.read(*head, columns, time_of_day))
+        frames = [df for df in frames if len(df)] or frames[-1:]
+        if len(frames) == 1:
+            return frames[0]
+        df = pd.concat(frames, ignore_index=True)
+        # Stored and merged rows with different flag categories concatenate to object columns
+        for column in FLAG_COLUMNS:
+            if column in columns and df[column].dtype != 'category':
+                df[column] = df[column].astype('category')
+        df.attrs['sensor_id'] = self.sensor_id
+        return df
+
+    def split_table(self, name, first_day, end_day):
+        """Return one per-day table for days in [first_day, end_day), days before the split read from the database"""
+        tail = getattr(self.tail, name)(first_day, end_day)
+        head = self.head_bounds(first_day, None if end_day is None else to_datetime64(end_day) - ONE_NS)
+        if head is None:
+            return tail
+        return np.concatenate([getattr(self.base, name)(head[0], head[1] + ONE_NS), tail])
+
+    def daily_table(self, first_day, end_day):
+        """Return the per-day aggregates for days in [first_day, end_day)"""
+        return self.split_table('daily_table', first_day, end_day)
+
+    def slot_table(self, first_day, end_day):
+        """Return the per-day, per-15-minute-slot aggregates for days in [first_day, end_day)"""
+        return self.split_table('slot_table', first_day, end_day)
+
+    def sketch_table(self, first_day, end_day):
+        """Return the per-day quantile sketches for days in [first_day, end_day)"""
+        return self.split_table('sketch_table', first_day, end_day)
+
+    def rollup(self, level, start=None, end=None):
+        """Return the min/mean/max rows of one rollup level for the buckets overlapping [start, end]"""
+        df = self.tail.rollup(level, start, end)
+        head = self.head_bounds(start, end)
+        if head is not None:
+            df = pd.concat([self.base.rollup(level, *head), df], ignore_index=True)
+            df.attrs['sensor_id'] = self.sensor_id
+        return df
+
+    def merge(self, new):
+        """Return a history with a sorted new frame merged in; days before the new data stay in the database"""
+        if new.empty:
+            return self
+        return merge_from(self, self.base, min(first_new_day(new), self.split), new)
+
+def first_new_day(new):
+    """Return the midnight starting the day of a sorted frame's first timestamp"""
+    return new['datetime'].to_numpy()[0].astype('datetime64[D]').astype('datetime64[ns]')
+
+def merge_from(history, base, split, new):
+    """Merge a sorted new frame into the rows of history from split on, over the stored base"""
+    old = history.read(split)
+    tail = SensorHistory.from_frame(merge_sensor_frames(old, new), history.sensor_id)
+    return SqliteMergedHistory(base, split, tail, len(history) - len(old))
+
+def sensor_from_catalog(row, path=SQLITE_PATH):
+    """Open a SqliteSensorHistory from a (sensor_id, rows, first, last, interval, version) row of the sensors table"""
+    sensor_id, rows, first, last, interval, version = row
+    return SqliteSensorHistory(sensor_id, rows, np.datetime64(first, 'ns'), np.datetime64(last, 'ns'), interval, version, path)
+
+def read_sensor(sensor_id, path=SQLITE_PATH):
+    """Open one stored sensor as a SqliteSensorHistory, or None if the sensor is not stored"""
+    with closing(connect(path)) as conn:
+        row = conn.execute(f"SELECT {CATALOG_COLUMNS} FROM sensors WHERE sensor_id = ?", (sensor_id,)).fetchone()
+    return None if row is None else sensor_from_catalog(row, path)
+
+def read_sensor_names(path=SQLITE_PATH):
+    """Load the stored sensor names"""
+    with closing(connect(path)) as conn:
+        return dict(conn.execute("SELECT sensor_id, name FROM sensor_names").fetchall())
+
+def read_sensor_store(path=SQLITE_PATH):
+    """Open all stored sensors as SqliteSensorHistory handles and load the names"""
+    with closing(connect(path)) as conn:
+        rows = conn.execute(f"SELECT {CATALOG_COLUMNS} FROM sensors ORDER BY sensor_id").fetchall()
+    sensor_data = {row[0]: sensor_from_catalog(row, path) for row in rows}
+    return sensor_data, read_sensor_names(path)
+
+def sensor_store_version(path=SQLITE_PATH):
+    """Return a token that changes whenever anything in the store is rewritten"""
+    if not os.path.exists(path):
+        return None
+    with closing(connect(path)) as conn:
+        version = conn.execute("SELECT value FROM store WHERE key = 'version'").fetchone()
+    return None if version is None else version[0]
+
+def update_sensor_store(sensor_id, update, path=SQLITE_PATH):
+    """Read one sensor and the names, write update(existing, sensor_names) back as that sensor, in one transaction"""
+    # update gets the stored history (or None) and may change sensor_names in place
+    with closing(connect(path)) as conn:
+        # The write lock is taken before the read, so no other save can land in between
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = read_sensor(sensor_id, path)
+            sensor_names = read_sensor_names(path)
+            data = update(existing, sensor_names)
+        except Exception:
+            conn.rollback()
+            raise
+        write_sensor_store({sensor_id: data}, sensor_names, path, conn=conn)
+    return existing, data
+
+def write_merged_rows(conn, history, version):
+    """Replace a sensor's rows from the split on with a merged history's, and rebuild only their aggregates"""
+    sensor_id, split = history.sensor_id, time_bound(history.split, None)
+    conn.execute("DELETE FROM readings WHERE sensor_id = ? AND datetime >= ?", (sensor_id, split))
+    for df in history.tail.frames():
+        conn.executemany("INSERT OR REPLACE INTO readings VALUES (?, ?, ?, ?, ?, ?)", frame_records(df, sensor_id))
+    interval = history.catalog['interval']
+    build_aggregates(conn, sensor_id, history.split, interval)
+
+    # Counted from the stored days, since another save may have changed the rows before the split
+    conn.execute(
+        f"INSERT OR REPLACE INTO sensors ({CATALOG_COLUMNS}) SELECT ?, "
+        "(SELECT SUM(count) FROM daily WHERE sensor_id = ?), "
+        "(SELECT MIN(datetime) FROM readings WHERE sensor_id = ?), "
+        "(SELECT MAX(datetime) FROM readings WHERE sensor_id = ?), ?, ?",
+        (sensor_id, sensor_id, sensor_id, sensor_id, None if interval is None else interval.value, version)
+    )
+
+def write_sensor_store(changed_data, sensor_names, path=SQLITE_PATH, replace_all=False, conn=None):
+    """Write only the given sensors (frames or histories, None deletes one) and the names; replace_all also deletes unlisted sensors"""
+    own_connection = conn is None
+    if own_connection:
+        conn = connect(path)
+    try:
+        # One transaction per save: readers see either the old or the new rows of a sensor
+        with conn:
+            version = (store_value(conn, 'version') or 0) + 1
+            if replace_all:
+                stored = [sensor_id for (sensor_id,) in conn.execute("SELECT sensor_id FROM sensors")]
+                changed_data = {**{sensor_id: None for sensor_id in stored}, **changed_data}
+
+            for sensor_id, data in changed_data.items():
+                # A handle on this same database already is what is stored
+                if isinstance(data, SqliteSensorHistory) and os.path.samefile(data.path, path):
+                    continue
+                if isinstance(data, SqliteMergedHistory) and os.path.samefile(data.base.path, path):
+                    write_merged_rows(conn, data, version)
+                    continue
+                conn.execute("DELETE FROM readings WHERE sensor_id = ?", (sensor_id,))
+                conn.execute("DELETE FROM sensors WHERE sensor_id = ?", (sensor_id,))
+                if data is None:
+                    delete_aggregates(conn, sensor_id)
+                    continue
+
+                history = as_sensor_history(data, sensor_id)
+                for df in history.frames():
+                    conn.executemany("INSERT OR REPLACE INTO readings VALUES (?, ?, ?, ?, ?, ?)", frame_records(df, sensor_id))
+                # Empty sensors keep their row, as in the .npy store; their first/last are never read
+                interval = history.catalog['interval']
+                conn.execute(
+                    f"INSERT INTO sensors ({CATALOG_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+                    (sensor_id, len(history), time_bound(history.start, 0), time_bound(history.end, 0),
+                     None if interval is None else interval.value, version)
+                )
+                build_aggregates(conn, sensor_id, interval=interval)
+
+            conn.execute("DELETE FROM sensor_names")
+            conn.executemany("INSERT INTO sensor_names VALUES (?, ?)", sensor_names.items())
+            conn.execute("INSERT OR REPLACE INTO store VALUES ('version', ?)", (version,))
+    finally:
+        if own_connection:
+            conn.close()
@@ -0,0 +1,681 @@
+"""Persistent storage for sensor frames and names
+
+Each sensor is stored as raw .npy columns in its own versioned directory, so
+saving one sensor (or just renaming it) never rewrites the others. Inside a
+version the history is split into month partitions with a small index, so a
+time-range read only opens the months it overlaps:
+
+    sensor_store/
+        manifest.json           store version, sensor names, current version and catalog per sensor
+        retired.json            replaced versions waiting to be deleted
+        sensor_1/v7/
+            partitions.json     month key, first/last timestamp, rows and sample interval per partition
+            2024-01/            datetime.npy, temperature.npy, humidity.npy,
+                                temp_comfort.npy, humidity_comfort.npy (category codes),
+                                daily.npy, slots.npy, rollup_*.npy, meta.json
+
+manifest.json is replaced atomically after the new column files are complete,
+so readers always see either the old or the new version of a sensor. Its
+catalog holds each sensor's first/last timestamp, row count, sample interval
+and version, so the dashboard gets bounds and counts without opening any
+partition.
+Replaced versions are not deleted by the write: histories loaded earlier may
+still read or link their partitions. They are listed in retired.json and
+deleted by collect_retired_versions once no partition in the dashboard
+process refers to them.
+Partitions that did not change are hard-linked into the new version. Each
+partition also stores its aggregate tables: per-day and per-15-minute-slot
+sums, per-day quantile sketches and the min/mean/max rollup pyramid (see
+sensor_aggregates).
+"""
+import itertools
+import json
+import os
+import pickle
+import shutil
+import threading
+import weakref
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from sensor_aggregates import (
+    build_aggregate_tables, build_rollup_table, build_sketch_table, median_interval, rollup_bucket_start, rollup_frame,
+    rollup_from_daily_table, rollup_from_slots, time_of_day_mask, time_of_day_slots
+)
+from sensor_ingest import CSV_COLUMNS, FLAG_COLUMNS, READING_COLUMNS, compact_sensor_frame, merge_sensor_frames
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer deployments only
+    fcntl = None
+
+# Directory of the per-sensor columnar store
+STORE_DIR = "sensor_store"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+PARTITION_INDEX_FILE = "partitions.json"
+RETIRED_FILE = "retired.json"
+
+# Memory-map stored columns instead of reading them, so a session starts without
+# loading the history and only the pages a chart touches are read from disk
+STORE_MMAP = os.environ.get('SENSOR_STORE_MMAP', '1') != '0'
+
+# Pickle files written by earlier versions, converted once into the store
+SENSOR_DATA_FILE = "sensor_data.pkl"
+SENSOR_NAMES_FILE = "sensor_names.pkl"
+
+# Identifies in-memory histories, which have no store version
+HISTORY_TOKENS = itertools.count()
+
+# Stored partitions still referenced in this process; their version directories are not collected
+LIVE_PARTITIONS = weakref.WeakSet()
+LIVE_PARTITIONS_LOCK = threading.Lock()
+
+def atomic_write_json(obj, path):
+    """Write JSON to a temporary file and rename it over the target so readers never see a partial file"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(obj, f)
+    os.replace(temp_path, path)
+
+@contextmanager
+def store_lock(store_dir=STORE_DIR):
+    """Serialize writers (dashboard sessions and the ingest CLI) on the store"""
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, LOCK_FILE), 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+def read_manifest(store_dir=STORE_DIR):
+    """Return the store manifest, or an empty one if nothing has been stored yet"""
+    try:
+        with open(os.path.join(store_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'version': 0, 'names': {}, 'sensors': {}}
+
+def sensor_version_dir(sensor_id, version, store_dir=STORE_DIR):
+    """Return the directory holding one stored version of a sensor"""
+    return os.path.join(store_dir, f"sensor_{sensor_id}", f"v{version}")
+
+def read_retired_versions(store_dir=STORE_DIR):
+    """Return the version directories replaced by writes and not yet deleted"""
+    try:
+        with open(os.path.join(store_dir, RETIRED_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+def collect_retired_versions(store_dir=STORE_DIR):
+    """Delete replaced versions that no stored partition in this process still refers to
+
+    Only the dashboard process, which holds histories across writes, collects;
+    the ingest CLI reads and writes under the store lock, which this takes too.
+    """
+    if not read_retired_versions(store_dir):
+        return
+    with store_lock(store_dir):
+        with LIVE_PARTITIONS_LOCK:
+            live = {os.path.abspath(os.path.dirname(partition.directory)) for partition in LIVE_PARTITIONS}
+        retired = read_retired_versions(store_dir)
+        kept = [directory for directory in retired if os.path.abspath(os.path.join(store_dir, directory)) in live]
+        for directory in retired:
+            if directory not in kept:
+                shutil.rmtree(os.path.join(store_dir, directory), ignore_errors=True)
+        if len(kept) < len(retired):
+            atomic_write_json(kept, os.path.join(store_dir, RETIRED_FILE))
+
+def sensor_store_version(store_dir=STORE_DIR):
+    """Return a token that changes whenever anything in the store is rewritten"""
+    try:
+        return os.stat(os.path.join(store_dir, MANIFEST_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def write_sensor_columns(df, directory):
+    """Write one sensor frame as .npy column files plus a small meta.json"""
+    os.makedirs(directory, exist_ok=True)
+    # The view drops pandas' dtype metadata, which .npy cannot store
+    np.save(os.path.join(directory, 'datetime.npy'), df['datetime'].to_numpy().view('datetime64[ns]'))
+    for column in READING_COLUMNS:
+        np.save(os.path.join(directory, f"{column}.npy"), df[column].to_numpy())
+
+    categories = {}
+    for column in FLAG_COLUMNS:
+        np.save(os.path.join(directory, f"{column}.npy"), df[column].cat.codes.to_numpy())
+        categories[column] = df[column].cat.categories.tolist()
+
+    for name, table in build_aggregate_tables(df).items():
+        np.save(os.path.join(directory, f"{name}.npy"), table)
+    atomic_write_json({'rows': len(df), 'categories': categories}, os.path.join(directory, 'meta.json'))
+
+def load_column(directory, column, mmap=STORE_MMAP):
+    """Load one .npy column read-only, since loaded columns may be shared between sessions"""
+    array = np.load(os.path.join(directory, f"{column}.npy"), mmap_mode='r' if mmap else None)
+    array.flags.writeable = False
+    return array
+
+def read_sensor_columns(directory, sensor_id, mmap=STORE_MMAP):
+    """Read one sensor frame back from its .npy column files, memory-mapped unless mmap is False"""
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+
+    columns = {column: load_column(directory, column, mmap) for column in ['datetime'] + READING_COLUMNS}
+    for column in FLAG_COLUMNS:
+        codes = load_column(directory, column, mmap)
+        columns[column] = pd.Categorical.from_codes(codes, categories=meta['categories'][column])
+
+    # copy=False keeps every column backed by its own file instead of consolidating into new blocks
+    df = pd.DataFrame({column: columns[column] for column in CSV_COLUMNS}, copy=False)
+    df.attrs['sensor_id'] = sensor_id
+    return df
+
+def catalog_to_json(catalog):
+    """Convert a sensor catalog to JSON-safe integer nanoseconds"""
+    return {
+        'first': catalog['first'].value,
+        'last': catalog['last'].value,
+        'rows': catalog['rows'],
+        'interval': None if catalog['interval'] is None else catalog['interval'].value,
+        'version': catalog['version'],
+    }
+
+def catalog_from_json(entry):
+    """Convert a stored sensor catalog back to timestamps"""
+    return {
+        'first': pd.Timestamp(entry['first']),
+        'last': pd.Timestamp(entry['last']),
+        'rows': entry['rows'],
+        'interval': None if entry['interval'] is None else pd.Timedelta(entry['interval']),
+        'version': entry['version'],
+    }
+
+def to_datetime64(value):
+    """Convert a datetime-like bound (or None) to numpy datetime64[ns]"""
+    if value is None:
+        return None
+    return pd.Timestamp(value).to_datetime64().astype('datetime64[ns]')
+
+def time_slice(times, start=None, end=None):
+    """Return the (lo, hi) positions of sorted timestamps within [start, end] by binary search"""
+    lo = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+    hi = len(times) if end is None else int(np.searchsorted(times, end, side='right'))
+    return lo, max(lo, hi)
+
+def frame_view(df, lo, hi, columns=CSV_COLUMNS):
+    """Return rows lo:hi of the given columns as a frame of views, without copying column data"""
+    view = pd.DataFrame({
+        column: df[column].array[lo:hi] if column in FLAG_COLUMNS else df[column].to_numpy()[lo:hi]
+        for column in columns
+    }, copy=False)
+    view.attrs['sensor_id'] = df.attrs.get('sensor_id')
+    return view
+
+def frame_rows(df, lo, hi, columns=CSV_COLUMNS, time_of_day=None):
+    """Return rows lo:hi of the given columns, only those inside a time-of-day window if one is given"""
+    view = frame_view(df, lo, hi, columns)
+    if not time_of_day:
+        return view
+    # Only the rows inside the window are copied
+    rows = view[time_of_day_mask(df['datetime'].to_numpy()[lo:hi], time_of_day)].reset_index(drop=True)
+    rows.attrs['sensor_id'] = view.attrs['sensor_id']
+    return rows
+
+def empty_sensor_frame(sensor_id=None):
+    """Return a sensor frame with no rows in the compact schema"""
+    return compact_sensor_frame(pd.DataFrame({column: [] for column in CSV_COLUMNS}), sensor_id)
+
+class SensorPartition:
+    """One month of a sensor's history, either stored on disk or held in memory"""
+
+    def __init__(self, key, first, last, rows, directory=None, frame=None, interval=None):
+        self.key = key
+        self.first = first
+        self.last = last
+        self.rows = rows
+        self.interval = interval
+        self.directory = directory
+        self.frame = frame
+        # Aggregate tables by name, loaded or built on first use
+        self.tables = {}
+        if directory is not None:
+            with LIVE_PARTITIONS_LOCK:
+                LIVE_PARTITIONS.add(self)
+
+    def load(self, sensor_id, mmap=STORE_MMAP):
+        """Return the partition's frame, reading it from disk on first use"""
+        frame = self.frame
+        if frame is None:
+            frame = self.frame = read_sensor_columns(self.directory, sensor_id, mmap)
+        return frame
+
+    def sample_interval(self, sensor_id, mmap=STORE_MMAP):
+        """Return the median spacing of the partition's timestamps, computed once if the index lacks it"""
+        if self.interval is None and self.rows > 1:
+            self.interval = median_interval(self.load(sensor_id, mmap)['datetime'].to_numpy())
+        return self.interval
+
+    def aggregate_table(self, name, sensor_id, mmap=STORE_MMAP):
+        """Return one of the partition's aggregate tables, stored at ingest or built once from its rows"""
+        table = self.tables.get(name)
+        if table is None:
+            path = os.path.join(self.directory, f"{name}.npy") if self.directory is not None else None
+            if path is not None and os.path.exists(path):
+                table = self.tables[name] = np.load(path, mmap_mode='r' if mmap else None)
+            elif name.startswith('rollup_'):
+                # Levels no wider than the sample interval are not stored; their buckets come from the rows
+                table = self.tables[name] = build_rollup_table(self.load(sensor_id, mmap), name[len('rollup_'):])
+            else:
+                # In-memory partitions and ones stored before the table existed
+                self.tables.update(build_aggregate_tables(self.load(sensor_id, mmap)))
+                table = self.tables[name]
+        return table
+
+    def unload(self):
+        """Drop the loaded frame and aggregate tables of a stored partition; they are read again on next use"""
+        if self.directory is not None:
+            self.frame = None
+            self.tables = {}
+
+    @property
+    def loaded_bytes(self):
+        """Bytes held by the loaded frame and tables (mapped bytes for memory-mapped partitions)"""
+        if self.directory is None:
+            return 0
+        frame = self.frame
+        loaded = 0 if frame is None else int(frame.memory_usage(index=False).sum())
+        return loaded + sum(table.nbytes for table in self.tables.values())
+
+class SensorHistory:
+    """Read-only handle on one sensor's history; only the partitions a read overlaps are loaded"""
+
+    def __init__(self, sensor_id, partitions, mmap=STORE_MMAP):
+        self.sensor_id = sensor_id
+        self.partitions = partitions
+        self.mmap = mmap
+        # Set by SensorCache for shared histories, so reads count towards its memory cap
+        self.cache = None
+        self._firsts = np.array([partition.first for partition in partitions], dtype='datetime64[ns]')
+        self._lasts = np.array([partition.last for partition in partitions], dtype='datetime64[ns]')
+        # In-memory histories keep the frame their partitions were cut from, so reads across months stay views
+        self._frame = None
+        # Store version of a stored history (None in memory) and its memoized catalog
+        self.version = None
+        self.token = next(HISTORY_TOKENS)
+        self._catalog = None
+
+    @classmethod
+    def from_frame(cls, df, sensor_id=None):
+        """Split a sorted in-memory sensor frame into month partitions"""
+        if sensor_id is None:
+            sensor_id = df.attrs.get('sensor_id')
+        times = df['datetime'].to_numpy()
+        months = times.astype('datetime64[M]')
+        bounds = np.flatnonzero(months[1:] != months[:-1]) + 1
+        starts = np.concatenate(([0], bounds)) if len(df) else []
+        ends = np.concatenate((bounds, [len(df)])) if len(df) else []
+
+        partitions = []
+        for start, end in zip(starts, ends):
+            partitions.append(SensorPartition(
+                str(months[start]), times[start], times[end - 1], int(end - start), frame=df.iloc[start:end],
+                interval=median_interval(times[start:end])
+            ))
+        history = cls(sensor_id, partitions)
+        history._frame = df
+        return history
+
+    def __len__(self):
+        return sum(partition.rows for partition in self.partitions)
+
+    @property
+    def start(self):
+        """First timestamp, or None for an empty history"""
+        return pd.Timestamp(self._firsts[0]) if self.partitions else None
+
+    @property
+    def end(self):
+        """Last timestamp, or None for an empty history"""
+        return pd.Timestamp(self._lasts[-1]) if self.partitions else None
+
+    @property
+    def data_key(self):
+        """Cheap identifier of the history's data: its store version, or a per-history token in memory"""
+        return ('version', self.version) if self.version is not None else ('history', self.token)
+
+    @property
+    def catalog(self):
+        """First/last timestamp, row count, median sample interval and store version of the history"""
+        # Histories never change, so the catalog is computed (or taken from the manifest) once
+        if self._catalog is None:
+            intervals = [partition.sample_interval(self.sensor_id, self.mmap) for partition in self.partitions if partition.rows > 1]
+            self._catalog = {
+                'first': self.start,
+                'last': self.end,
+                'rows': len(self),
+                'interval': pd.Timedelta(int(np.median(np.array(intervals, dtype='int64')))) if intervals else None,
+                'version': self.version,
+            }
+        return self._catalog
+
+    def partitions_between(self, start=None, end=None):
+        """Return the partitions overlapping [start, end] (inclusive, either may be None)"""
+        lo = 0 if start is None else int(np.searchsorted(self._lasts, to_datetime64(start), side='left'))
+        hi = len(self.partitions) if end is None else int(np.searchsorted(self._firsts, to_datetime64(end), side='right'))
+        return self.partitions[lo:hi]
+
+    def frames(self):
+        """Yield the frame of every partition in time order"""
+        for partition in self.partitions:
+            yield partition.load(self.sensor_id, self.mmap)
+        if self.cache is not None:
+            self.cache.touch(self)
+
+    def unload(self):
+        """Drop every loaded stored partition"""
+        for partition in self.partitions:
+            partition.unload()
+
+    @property
+    def loaded_bytes(self):
+        """Bytes held by loaded stored partitions"""
+        return sum(partition.loaded_bytes for partition in self.partitions)
+
+    def read(self, start=None, end=None, columns=CSV_COLUMNS, time_of_day=None):
+        """Return the rows between start and end (inclusive, either may be None) as one frame"""
+        # Rows are cut by binary search on the sorted timestamps; a range inside one partition
+        # (or any range of an in-memory history) is returned as views without copying.
+        # time_of_day is an inclusive (start_time, end_time) window; start_time > end_time crosses midnight
+        start, end = to_datetime64(start), to_datetime64(end)
+        if self._frame is not None:
+            lo, hi = time_slice(self._frame['datetime'].to_numpy(), start, end)
+            return frame_rows(self._frame, lo, hi, columns, time_of_day)
+
+        frames = []
+        for partition in self.partitions_between(start, end):
+            df = partition.load(self.sensor_id, self.mmap)
+            lo, hi = time_slice(df['datetime'].to_numpy(), start, end)
+            if hi > lo:
+                frames.append(frame_rows(df, lo, hi, columns, time_of_day))
+        if self.cache is not None:
+            self.cache.touch(self)
+
+        if not frames:
+            return empty_sensor_frame(self.sensor_id)[columns]
+        if len(frames) == 1:
+            return frames[0]
+        df = pd.concat(frames, ignore_index=True)
+        # Partitions with different flag categories concatenate to object columns
+        for column in FLAG_COLUMNS:
+            if column in columns and df[column].dtype != 'category':
+                df[column] = df[column].astype('category')
+        df.attrs['sensor_id'] = self.sensor_id
+        return df
+
+    def aggregate_table(self, name, start=None, end=None):
+        """Return the rows of one aggregate table whose day or bucket start lies in [start, end)"""
+        start, end = to_datetime64(start), to_datetime64(end)
+        partitions = self.partitions_between(start, None if end is None else end - np.timedelta64(1, 'ns'))
+        tables = [partition.aggregate_table(name, self.sensor_id, self.mmap) for partition in partitions]
+        if self.cache is not None:
+            self.cache.touch(self)
+        table = np.concatenate(tables) if tables else build_aggregate_tables(empty_sensor_frame())[name]
+        keys = table[table.dtype.names[0]]
+        lo = 0 if start is None else int(np.searchsorted(keys, start))
+        hi = len(keys) if end is None else int(np.searchsorted(keys, end))
+        return table[lo:max(lo, hi)]
+
+    def daily_table(self, first_day, end_day):
+        """Return the per-day aggregates for days in [first_day, end_day)"""
+        return self.aggregate_table('daily', first_day, end_day)
+
+    def slot_table(self, first_day, end_day):
+        """Return the per-day, per-15-minute-slot aggregates for days in [first_day, end_day)"""
+        return self.aggregate_table('slots', first_day, end_day)
+
+    def sketch_table(self, first_day, end_day):
+        """Return the per-day quantile sketches for days in [first_day, end_day)"""
+        return self.aggregate_table('sketches', first_day, end_day)
+
+    def rollup(self, level, start=None, end=None):
+        """Return the min/mean/max rows of one rollup level for the buckets overlapping [start, end]"""
+        start, end = rollup_bucket_start(to_datetime64(start), level), to_datetime64(end)
+        table = self.aggregate_table(f"rollup_{level}", start, None if end is None else end + np.timedelta64(1, 'ns'))
+        df = pd.DataFrame(table)
+        df.attrs['sensor_id'] = self.sensor_id
+        return df
+
+    def whole_buckets(self, unit, start, end):
+        """Return the first and the end (exclusive) of the hourly or daily buckets lying wholly inside [start, end]"""
+        # Buckets inside this span come from the stored aggregates; only the
+        # partial buckets at either edge are computed from raw rows
+        width = np.timedelta64(1, unit)
+        first = (self.start.to_datetime64() if start is None else start).astype(f'datetime64[{unit}]')
+        if start is not None and first < start:
+            first += width
+        end_bucket = (self.end.to_datetime64() if end is None else end + np.timedelta64(1, 'ns')).astype(f'datetime64[{unit}]')
+        if end is None:
+            end_bucket += width
+        return first, end_bucket
+
+    def window_buckets(self, unit, start=None, end=None, time_of_day=None):
+        """Return hourly ('h') or daily ('D') count and min/mean/max of the rows between start and end"""
+        # time_of_day is an inclusive (start_time, end_time) window; start_time > end_time crosses midnight
+        if not len(self):
+            return rollup_frame(empty_sensor_frame(self.sensor_id), np.timedelta64(1, unit))
+        start, end = to_datetime64(start), to_datetime64(end)
+        width = np.timedelta64(1, unit)
+        one_ns = np.timedelta64(1, 'ns')
+        first, end_bucket = self.whole_buckets(unit, start, end)
+
+        columns = ['datetime'] + READING_COLUMNS
+        if first >= end_bucket:
+            return rollup_frame(self.read(start, end, columns), width, time_of_day)
+
+        edges = [self.read(start, first - one_ns, columns) if start is not None else None,
+                 self.read(end_bucket, end, columns) if end is not None else None]
+        parts = [rollup_frame(edge, width, time_of_day) for edge in edges if edge is not None and not edge.empty]
+        slots = time_of_day_slots(time_of_day) if time_of_day else None
+        if time_of_day and (unit != 'D' or slots is None):
+            # Hourly buckets and windows off the 15-minute marks fall back to the raw rows
+            parts.append(rollup_frame(self.read(first, end_bucket - one_ns, columns), width, time_of_day))
+        elif time_of_day:
+            parts.append(rollup_from_slots(self.slot_table(first, end_bucket), slots))
+        elif unit == 'D':
+            parts.append(rollup_from_daily_table(self.daily_table(first, end_bucket)))
+        else:
+            parts.append(self.rollup('1h', first, end_bucket - one_ns))
+        buckets = pd.concat(parts, ignore_index=True)
+        return buckets.sort_values('datetime', ignore_index=True)
+
+    def day_sketches(self, start=None, end=None):
+        """Return per-day quantile sketches of the rows between start and end"""
+        if not len(self):
+            return build_sketch_table(empty_sensor_frame(self.sensor_id))
+        start, end = to_datetime64(start), to_datetime64(end)
+        one_ns = np.timedelta64(1, 'ns')
+        first, end_day = self.whole_buckets('D', start, end)
+
+        columns = ['datetime'] + READING_COLUMNS
+        if first >= end_day:
+            return build_sketch_table(self.read(start, end, columns))
+        parts = [self.sketch_table(first, end_day)]
+        if start is not None:
+            parts.insert(0, build_sketch_table(self.read(start, first - one_ns, columns)))
+        if end is not None:
+            parts.append(build_sketch_table(self.read(end_day, end, columns)))
+        return np.concatenate(parts)
+
+    def merge(self, new):
+        """Return a history with a sorted new frame merged in; months before the new data are reused as they are"""
+        if new.empty:
+            return self
+        first_month = str(new['datetime'].to_numpy()[0].astype('datetime64[M]'))
+        kept = [partition for partition in self.partitions if partition.key < first_month]
+        tail = SensorHistory(self.sensor_id, self.partitions[len(kept):], self.mmap).read()
+        merged = merge_sensor_frames(tail, new)
+        return SensorHistory(self.sensor_id, kept + SensorHistory.from_frame(merged, self.sensor_id).partitions, self.mmap)
+
+def as_sensor_history(data, sensor_id):
+    """Accept either a sensor frame or a SensorHistory"""
+    if isinstance(data, SensorHistory):
+        return data
+    return SensorHistory.from_frame(data, sensor_id)
+
+def link_partition(source_dir, directory):
+    """Hard-link a stored partition's files into another version directory"""
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(source_dir):
+        os.link(os.path.join(source_dir, name), os.path.join(directory, name))
+
+def write_sensor_history(history, directory):
+    """Write a history's partitions and partition index into a version directory"""
+    os.makedirs(directory, exist_ok=True)
+    index = []
+    for partition in history.partitions:
+        partition_dir = os.path.join(directory, partition.key)
+        linked = False
+        if partition.directory is not None:
+            # Unchanged stored partitions are linked instead of rewritten
+            try:
+                link_partition(partition.directory, partition_dir)
+                linked = True
+            except OSError:
+                shutil.rmtree(partition_dir, ignore_errors=True)
+        if not linked:
+            write_sensor_columns(partition.load(history.sensor_id, history.mmap), partition_dir)
+        index.append({
+            'key': partition.key,
+            'first': int(partition.first.astype('int64')),
+            'last': int(partition.last.astype('int64')),
+            'rows': partition.rows,
+            'interval': None if partition.rows < 2 else int(partition.sample_interval(history.sensor_id, history.mmap).astype('int64')),
+        })
+    atomic_write_json(index, os.path.join(directory, PARTITION_INDEX_FILE))
+
+def read_sensor(sensor_id, store_dir=STORE_DIR, manifest=None, mmap=STORE_MMAP):
+    """Open one stored sensor as a SensorHistory, or None if the sensor has no data"""
+    if manifest is None:
+        manifest = read_manifest(store_dir)
+    version = manifest['sensors'].get(str(sensor_id))
+    if version is None:
+        return None
+
+    directory = sensor_version_dir(sensor_id, version, store_dir)
+    with open(os.path.join(directory, PARTITION_INDEX_FILE)) as f:
+        index = json.load(f)
+    partitions = [
+        SensorPartition(
+            entry['key'],
+            np.datetime64(entry['first'], 'ns'),
+            np.datetime64(entry['last'], 'ns'),
+            entry['rows'],
+            directory=os.path.join(directory, entry['key']),
+            interval=None if entry.get('interval') is None else np.timedelta64(entry['interval'], 'ns')
+        )
+        for entry in index
+    ]
+    history = SensorHistory(sensor_id, partitions, mmap)
+    history.version = version
+    # Manifests written before the catalog existed leave it to be computed from the partitions
+    catalog = manifest.get('catalog', {}).get(str(sensor_id))
+    if catalog is not None:
+        history._catalog = catalog_from_json(catalog)
+    return history
+
+def read_sensor_names(store_dir=STORE_DIR):
+    """Load the stored sensor names"""
+    return {int(sensor_id): name for sensor_id, name in read_manifest(store_dir)['names'].items()}
+
+def read_legacy_pickles(data_file=SENSOR_DATA_FILE, names_file=SENSOR_NAMES_FILE):
+    """Load sensor frames and names from the old whole-dict pickle files"""
+    with open(data_file, 'rb') as f:
+        sensor_data = pickle.load(f)
+    with open(names_file, 'rb') as f:
+        sensor_names = pickle.load(f)
+
+    # Older pickles hold the wide float64/object schema
+    sensor_data = {sensor_id: compact_sensor_frame(df, sensor_id) for sensor_id, df in sensor_data.items()}
+    return sensor_data, sensor_names
+
+def migrate_legacy_pickles(store_dir=STORE_DIR, data_file=SENSOR_DATA_FILE, names_file=SENSOR_NAMES_FILE):
+    """Convert sensor_data.pkl/sensor_names.pkl into the per-sensor store once"""
+    # The pickle files are left in place as a backup; the manifest marks the migration as done
+    if os.path.exists(os.path.join(store_dir, MANIFEST_FILE)):
+        return False
+    if not (os.path.exists(data_file) and os.path.exists(names_file)):
+        return False
+
+    sensor_data, sensor_names = read_legacy_pickles(data_file, names_file)
+    write_sensor_store(sensor_data, sensor_names, store_dir)
+    return True
+
+def read_sensor_store(store_dir=STORE_DIR, mmap=STORE_MMAP):
+    """Open all stored sensors as SensorHistory handles and load the names, or empty dicts if nothing is stored"""
+    migrate_legacy_pickles(store_dir)
+
+    manifest = read_manifest(store_dir)
+    sensor_data = {}
+    for sensor_id in manifest['sensors']:
+        sensor_data[int(sensor_id)] = read_sensor(int(sensor_id), store_dir, manifest, mmap)
+    sensor_names = {int(sensor_id): name for sensor_id, name in manifest['names'].items()}
+    return sensor_data, sensor_names
+
+def update_sensor_store(sensor_id, update, store_dir=STORE_DIR):
+    """Read one sensor and the names, write update(existing, sensor_names) back as that sensor, all under one lock"""
+    # update gets the stored history (or None) and may change sensor_names in place; holding the
+    # lock from the read to the write keeps a concurrent save from being overwritten
+    migrate_legacy_pickles(store_dir)
+    with store_lock(store_dir):
+        existing = read_sensor(sensor_id, store_dir)
+        sensor_names = read_sensor_names(store_dir)
+        data = update(existing, sensor_names)
+        write_locked_sensor_store({sensor_id: data}, sensor_names, store_dir)
+    return existing, data
+
+def write_sensor_store(changed_data, sensor_names, store_dir=STORE_DIR, replace_all=False):
+    """Write only the given sensors (frames or histories, None deletes one) and the names; replace_all also deletes unlisted sensors"""
+    with store_lock(store_dir):
+        write_locked_sensor_store(changed_data, sensor_names, store_dir, replace_all)
+
+def write_locked_sensor_store(changed_data, sensor_names, store_dir=STORE_DIR, replace_all=False):
+    """write_sensor_store for a caller that already holds the store lock"""
+    manifest = read_manifest(store_dir)
+    replaced_dirs = []
+
+    if replace_all:
+        changed_data = {**{int(sensor_id): None for sensor_id in manifest['sensors']}, **changed_data}
+
+    catalog = manifest.setdefault('catalog', {})
+    for sensor_id, data in changed_data.items():
+        catalog.pop(str(sensor_id), None)
+        previous_version = manifest['sensors'].pop(str(sensor_id), None)
+        if previous_version is not None:
+            replaced_dirs.append(os.path.relpath(sensor_version_dir(sensor_id, previous_version, store_dir), store_dir))
+
+        if data is not None:
+            manifest['version'] += 1
+            history = as_sensor_history(data, sensor_id)
+            write_sensor_history(history, sensor_version_dir(sensor_id, manifest['version'], store_dir))
+            manifest['sensors'][str(sensor_id)] = manifest['version']
+            if len(history):
+                catalog[str(sensor_id)] = catalog_to_json({**history.catalog, 'version': manifest['version']})
+
+    # Sensors stored before the catalog existed get their entry on the next write
+    for sensor_id, version in manifest['sensors'].items():
+        if sensor_id not in catalog:
+            history = read_sensor(int(sensor_id), store_dir, manifest)
+            if len(history):
+                catalog[sensor_id] = catalog_to_json(history.catalog)
+
+    manifest['version'] += 1
+    manifest['names'] = {str(sensor_id): name for sensor_id, name in sensor_names.items()}
+    atomic_write_json(manifest, os.path.join(store_dir, MANIFEST_FILE))
+
+    # Old versions are only retired: histories loaded before this write may still read them
+    if replaced_dirs:
+        retired = read_retired_versions(store_dir) + replaced_dirs
+        atomic_write_json(retired, os.path.join(store_dir, RETIRED_FILE))
@@ -0,0 +1,145 @@
+"""Background write-behind persistence
+
+Saves are handed to one background thread instead of writing on the request
+thread. Repeated saves of the same key are coalesced while they wait, and a
+key is only written once it has been quiet for WRITE_BEHIND_DELAY_SECONDS
+(or has waited WRITE_BEHIND_MAX_DELAY_SECONDS during a continuous burst).
+A failed write stays pending and is retried with a growing delay (up to
+WRITE_BEHIND_MAX_RETRY_SECONDS); its error is kept until the key is written,
+so the dashboard can show it. Pending writes are flushed when the process
+exits.
+"""
+import atexit
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+WRITE_BEHIND_DELAY_SECONDS = 0.5
+WRITE_BEHIND_MAX_DELAY_SECONDS = 5.0
+WRITE_BEHIND_RETRY_SECONDS = 2.0
+WRITE_BEHIND_MAX_RETRY_SECONDS = 60.0
+
+def atomic_write_pickle(obj, path):
+    """Pickle to a temporary file, fsync it and rename it over the target so a crash never leaves a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+class WriteBehindPersister:
+    """Coalesce, debounce and run writes on a single background thread"""
+
+    def __init__(self, delay=WRITE_BEHIND_DELAY_SECONDS, max_delay=WRITE_BEHIND_MAX_DELAY_SECONDS):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.writes = 0
+        self.failures = 0
+        # key -> [value, write, first submit time, last submit time, combine, earliest retry time]
+        self._pending = {}
+        # key -> (error message, failed attempts in a row) until the key is written
+        self._errors = {}
+        self._in_flight = set()
+        self._condition = threading.Condition()
+        # Held while taking a value and writing it, so an older value can never land after a newer one
+        self._write_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, key, value, write, combine=None):
+        """Schedule write(value) for key, replacing (or combine()-ing with) a value still waiting for that key"""
+        now = time.monotonic()
+        with self._condition:
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = [value, write, now, now, combine, now]
+            else:
+                pending[0] = value if combine is None else combine(pending[0], value)
+                pending[1] = write
+                pending[3] = now
+                pending[4] = combine
+            self._condition.notify()
+
+    def is_pending(self, key):
+        """Check whether a write for key is waiting or in progress"""
+        with self._condition:
+            return key in self._pending or key in self._in_flight
+
+    def failed(self):
+        """Return {key: (error message, failed attempts)} for keys whose last write failed and is being retried"""
+        with self._condition:
+            return dict(self._errors)
+
+    def flush(self):
+        """Run all waiting writes now on the calling thread"""
+        with self._write_lock:
+            with self._condition:
+                pending, self._pending = self._pending, {}
+                self._in_flight.update(pending)
+            for key, entry in pending.items():
+                self._write(key, entry)
+
+    def _due_time(self, entry):
+        """Return when a pending entry should be written"""
+        _, _, first_submit, last_submit, _, retry_at = entry
+        return max(retry_at, min(last_submit + self.delay, first_submit + self.max_delay))
+
+    def _run(self):
+        """Background loop: wait for the earliest due key and write it"""
+        while True:
+            with self._condition:
+                while True:
+                    if not self._pending:
+                        self._condition.wait()
+                        continue
+                    timeout = min(self._due_time(entry) for entry in self._pending.values()) - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+
+            with self._write_lock:
+                with self._condition:
+                    now = time.monotonic()
+                    due = [key for key, entry in self._pending.items() if self._due_time(entry) <= now]
+                    taken = {key: self._pending.pop(key) for key in due}
+                    self._in_flight.update(taken)
+                for key, entry in taken.items():
+                    self._write(key, entry)
+
+    def _write(self, key, entry):
+        """Run one write, keeping the thread alive if it fails and queueing the value again for a retry"""
+        value, write, _, _, combine, _ = entry
+        try:
+            write(value)
+        except Exception as e:
+            # A failed save must not stop later saves, nor be dropped: it is retried with backoff
+            with self._condition:
+                self.failures += 1
+                attempts = self._errors.get(key, (None, 0))[1] + 1
+                self._errors[key] = (f"{type(e).__name__}: {e}", attempts)
+                now = time.monotonic()
+                retry_at = now + min(WRITE_BEHIND_RETRY_SECONDS * 2 ** (attempts - 1), WRITE_BEHIND_MAX_RETRY_SECONDS)
+                newer = self._pending.get(key)
+                if newer is None:
+                    self._pending[key] = [value, write, now, now, combine, retry_at]
+                else:
+                    # A newer value arrived meanwhile; it replaces (or is combined with) the failed one
+                    if newer[4] is not None:
+                        newer[0] = newer[4](value, newer[0])
+                    newer[5] = max(newer[5], retry_at)
+                self._in_flight.discard(key)
+                self._condition.notify()
+        else:
+            with self._condition:
+                self.writes += 1
+                self._errors.pop(key, None)
+                self._in_flight.discard(key)